@@ -0,0 +1,103 @@
+# asyncio front end to regex.py, for services that must not block their
+# event loop on a slow compile or a long scan.
+#
+# compile_async() runs regex.compile_regex() in an executor (a shared
+# thread pool by default) and awaits the result. Concurrent requests for
+# the same pattern and options share one compilation: the first request
+# submits it and the others await the same concurrent.futures.Future,
+# which is forgotten once it is done, after which regex.pattern_cache
+# answers repeated requests. The future is shielded, so a cancelled
+# caller does not cancel the compilation the others are waiting for.
+#
+# filter_lines() greps the lines coming from an asyncio.StreamReader with
+# the table form of a compiled pattern, like regex.grep_file(), in batches
+# of about batch_size bytes of whole lines, and hands control back to the
+# loop after every batch, so a batch bounds how long the loop waits.
+
+import regex
+
+import asyncio
+import concurrent.futures
+import threading
+
+BATCH_SIZE = 1 << 16
+
+pending = {}
+pending_lock = threading.Lock()
+default_executor = None
+
+def get_default_executor():
+    global default_executor
+    with pending_lock:
+        if default_executor is None:
+            default_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix='compile_async')
+        return default_executor
+
+def compile_future(pattern, executor, options):
+    # the pending compilation of pattern with options, submitted if new
+    key = (pattern, tuple(sorted(options.items())))
+    with pending_lock:
+        future = pending.get(key)
+        if future is not None:
+            return future
+    if executor is None:
+        executor = get_default_executor()
+    with pending_lock:
+        # another thread may have submitted it meanwhile
+        future = pending.get(key)
+        if future is not None:
+            return future
+        future = executor.submit(regex.compile_regex, pattern, **options)
+        pending[key] = future
+    # outside the lock, as a callback added to a done future runs at once
+    future.add_done_callback(lambda _: forget(key, future))
+    return future
+
+def forget(key, future):
+    with pending_lock:
+        if pending.get(key) is future:
+            del pending[key]
+
+async def compile_async(pattern, executor=None, **options):
+    # options are those of regex.compile_regex()
+    future = compile_future(pattern, executor, options)
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+def table_of(matcher):
+    # table.TableDFA of a pattern compiled with the dfa or table engine
+    if hasattr(matcher, 'compiled'):
+        matcher = matcher.compiled()
+    if not hasattr(matcher, 'scan_lines'):
+        raise Exception('filter_lines needs a DFA, compile with engine=\'table\' or \'dfa\'')
+    return matcher
+
+async def filter_lines(reader, matcher, search=True, invert=False, batch_size=BATCH_SIZE):
+    # Yields the lines of reader (bytes, without their newline) that
+    # contain a match of matcher, or that match as a whole if not search,
+    # or the other lines if invert. A line longer than batch_size makes
+    # a batch of its own.
+    matcher = table_of(matcher)
+    rest = []
+    while True:
+        chunk = await reader.read(batch_size)
+        if not chunk:
+            break
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            rest.append(chunk)
+            continue
+        rest.append(chunk[:end])
+        block = b''.join(rest)
+        rest = [chunk[end:]]
+        for line in scan(matcher, block, search, invert):
+            yield line
+        # reader.read() does not suspend while data is buffered
+        await asyncio.sleep(0)
+    block = b''.join(rest)
+    if block:
+        for line in scan(matcher, block, search, invert):
+            yield line
+
+def scan(matcher, block, search, invert):
+    selected, _ = matcher.scan_lines(block, search=search, invert=invert)
+    return [block[start:end] for _, start, end in selected]
@@ -1,24 +1,20 @@
+import charset
 import syntax
+import table
+import threading
+import time
+from array import array
 from collections import defaultdict
 
+# raised by every DFA construction, including those of table.TableDFA
+TooManyStates = table.TooManyStates
+CompileTimeout = table.CompileTimeout
+
 class NFAState:
     def __init__(self):
         self.id = None
         self.transitions = defaultdict(set)
 
-    def epsilon_expansion(self):
-        epsilon_set = set()
-        new_set = {self}
-        while new_set:
-            next_new_set = set()
-            for state in new_set:
-                for dest_state in state.transitions[None]:
-                    if dest_state not in new_set and dest_state not in epsilon_set:
-                        next_new_set.add(dest_state)
-            epsilon_set |= new_set
-            new_set = next_new_set
-        self.epsilon_set = epsilon_set
-
     def __str__(self):
         out = '%s: {%s}' % (str(self.id),
                             ', '.join(['%s->%s' % (char, '|'.join([str(state.id) for state in dest_states])) \
@@ -27,6 +23,8 @@ class NFAState:
                                                    
 
 class NFA: # Non-deterministic Finite Automaton
+    # Char transitions are on class numbers rather than chars, with
+    # alphabet (a charset.CharMap) mapping chars to their class.
     def __init__(self, init_state=None, accept_state=None):
         if not init_state:
             init_state = NFAState()
@@ -34,6 +32,7 @@ class NFA: # Non-deterministic Finite Automaton
             accept_state = NFAState()
         self.init_state = init_state
         self.accept_state = accept_state
+        self.alphabet = None
 
     def __str__(self):
         out = '[init: %s (%s), accept: %s]\n' % \
@@ -63,7 +62,16 @@ class NFA: # Non-deterministic Finite Automaton
         return nfa
 
     @classmethod
-    def from_ast(cls, ast_node):
+    def from_ast(cls, ast, classes=None):
+        # classes (see charset.classes()) may be shared by several NFAs
+        if classes is None:
+            classes = charset.classes(syntax.char_sets(ast))
+        nfa = NFA.build(ast, classes.set_classes)
+        nfa.alphabet = classes.alphabet
+        return nfa
+
+    @classmethod
+    def build(cls, ast_node, set_classes):
         type2method = {
             syntax.EpsilonNode :        NFA.from_epsilon_ast_node,
             syntax.CharNode :           NFA.from_char_ast_node,
@@ -71,25 +79,25 @@ class NFA: # Non-deterministic Finite Automaton
             syntax.UnionNode :          NFA.from_union_ast_node,
             syntax.QuantificationNode : NFA.from_quantification_ast_node,
             }
-        nfa = type2method[type(ast_node)](ast_node)
+        nfa = type2method[type(ast_node)](ast_node, set_classes)
         return nfa
 
     @classmethod
-    def from_epsilon_ast_node(cls, ast_node=None):
+    def from_epsilon_ast_node(cls, ast_node=None, set_classes=None):
         nfa = NFA()
         nfa.init_state.transitions[None].add(nfa.accept_state)
         return nfa
 
     @classmethod
-    def from_char_ast_node(cls, ast_node):
+    def from_char_ast_node(cls, ast_node, set_classes):
         nfa = NFA()
-        for char in ast_node.char_set:
-            nfa.init_state.transitions[char].add(nfa.accept_state)
+        for char_class in set_classes[ast_node.intervals]:
+            nfa.init_state.transitions[char_class].add(nfa.accept_state)
         return nfa
 
     @classmethod
-    def from_concatenation_ast_node(cls, ast_node):
-        children_nfa = [NFA.from_ast(child) for child in ast_node.children]
+    def from_concatenation_ast_node(cls, ast_node, set_classes):
+        children_nfa = [NFA.build(child, set_classes) for child in ast_node.children]
         nfa = None
         for child_nfa in children_nfa:
             if not nfa:
@@ -99,8 +107,8 @@ class NFA: # Non-deterministic Finite Automaton
         return nfa
 
     @classmethod
-    def from_union_ast_node(cls, ast_node):
-        children_ast = [NFA.from_ast(child) for child in ast_node.children]
+    def from_union_ast_node(cls, ast_node, set_classes):
+        children_ast = [NFA.build(child, set_classes) for child in ast_node.children]
         nfa = NFA()
         for child_ast in children_ast:
             nfa.init_state.transitions[None].add(child_ast.init_state)
@@ -108,18 +116,18 @@ class NFA: # Non-deterministic Finite Automaton
         return nfa
 
     @classmethod
-    def from_quantification_ast_node(cls, ast_node):
+    def from_quantification_ast_node(cls, ast_node, set_classes):
         state = NFAState()
         nfa = NFA(init_state=state, accept_state=state)
         for _ in range(ast_node.lb):
-            operand_nfa = NFA.from_ast(ast_node.operand)
+            operand_nfa = NFA.build(ast_node.operand, set_classes)
             nfa.append_nfa(operand_nfa)
         if ast_node.ub < float('inf'):
             for _ in range(ast_node.lb, ast_node.ub):
-                optional_nfa = NFA.make_nfa_optional(NFA.from_ast(ast_node.operand))
+                optional_nfa = NFA.make_nfa_optional(NFA.build(ast_node.operand, set_classes))
                 nfa.append_nfa(optional_nfa)
         else:
-            kleene_closure_nfa = NFA.make_kleene_closure_of_nfa(NFA.from_ast(ast_node.operand))
+            kleene_closure_nfa = NFA.make_kleene_closure_of_nfa(NFA.build(ast_node.operand, set_classes))
             nfa.append_nfa(kleene_closure_nfa)
         return nfa
 
@@ -131,20 +139,24 @@ class NFA: # Non-deterministic Finite Automaton
             if state in states:
                 continue
             states.add(state)
-            for next_states in state.transitions.values():            
-                for next_state in next_states:
-                    stack.append(next_state)
+            for next_states in state.transitions.values():
+                stack.extend(next_states - states)
             if hasattr(state, 'epsilon_set'):
-                stack += list(state.epsilon_set)
+                stack.extend(state.epsilon_set - states)
 
         return states
                     
     def epsilon_expansion_and_numbering(self):
-        i = 0
-        for state in self.enum_states():
-            state.epsilon_expansion()
+        states = list(self.enum_states())
+        for i, state in enumerate(states):
             state.id = i
-            i += 1
+        successors = [[dest.id for dest in state.transitions[None]] for state in states]
+        # states of a closure shared by several states share one frozenset
+        epsilon_sets = {}
+        for state, closure in zip(states, epsilon_closures(successors)):
+            if id(closure) not in epsilon_sets:
+                epsilon_sets[id(closure)] = frozenset([states[i] for i in closure])
+            state.epsilon_set = epsilon_sets[id(closure)]
             
     def epsilon_elimination(self):
         self.epsilon_expansion_and_numbering()
@@ -156,6 +168,364 @@ class NFA: # Non-deterministic Finite Automaton
                     expanded_destinations |= dest_state.epsilon_set
                 state.transitions[char] = expanded_destinations
 
+    # NFA simulation over an epsilon-eliminated NFA, optionally resuming
+    # from an arbitrary set of states.
+    def match(self, s, states=None):
+        if states is None:
+            states = self.init_state.epsilon_set
+        alphabet = self.alphabet
+        for c in s:
+            char_class = alphabet[c]
+            next_states = set()
+            for state in states:
+                next_states.update(state.transitions.get(char_class, ()))
+            if not next_states:
+                return False
+            states = next_states
+        return self.accept_state in states
+
+class CompactNFA: # Thompson NFA over integer state ids, in flat arrays
+    # Characters are first grouped into classes by the char sets of the
+    # AST (class 0 is every char no CharNode mentions), see
+    # charset.classes(). With utf8, the NFA reads the UTF-8 encoding of
+    # the input instead: every CharNode becomes byte range sequences (see
+    # charset.utf8_sequences()) and classes group bytes. States are ints,
+    # and each state has at most one char transition: to targets[state]
+    # (-1 for none) on the classes read_classes[read_offsets[state]:
+    # read_offsets[state+1]]. Epsilon edges are stored the same CSR way in
+    # eps_offsets/eps_targets, and so are the epsilon closures of the
+    # targets, as sorted arrays in follow_offsets/follow_states. Closures
+    # only keep important states (those reading a char, and accept),
+    # which is all that matters for matching, and are all computed in one
+    # pass by epsilon_closures().
+    def __init__(self, alphabet, n_classes, n_states, start, accept, targets,
+                 read_offsets, read_classes, eps_offsets, eps_targets):
+        self.alphabet = alphabet
+        self.n_classes = n_classes
+        self.n_states = n_states
+        self.start = start
+        self.accept = accept
+        self.targets = targets
+        self.read_offsets = read_offsets
+        self.read_classes = read_classes
+        self.eps_offsets = eps_offsets
+        self.eps_targets = eps_targets
+        closures = epsilon_closures([eps_targets[eps_offsets[state]:eps_offsets[state + 1]]
+                                     for state in range(n_states)],
+                                    [target >= 0 or state == accept for state, target in enumerate(targets)])
+        self.start_states = closures[start]
+        self.follow_offsets, self.follow_states = csr([closures[target] if target >= 0 else ()
+                                                       for target in targets])
+
+    def __str__(self):
+        out = '[init: %s, accept: %d, classes: %d]\n' % \
+            ('|'.join([str(state) for state in self.start_states]), self.accept, self.n_classes)
+        for state in range(self.n_states):
+            if self.targets[state] >= 0:
+                out += '%d: %s->%s\n' % (state, '|'.join([str(cls) for cls in self.classes_of(state)]),
+                                         '|'.join([str(dest) for dest in self.follow_of(state)]))
+        return out
+
+    @classmethod
+    def from_ast(cls, ast, utf8=False):
+        builder = CompactNFABuilder(ast, utf8)
+        start, accept = builder.build(ast)
+        return builder.freeze(start, accept)
+
+    def classes_of(self, state):
+        return self.read_classes[self.read_offsets[state]:self.read_offsets[state + 1]]
+
+    def follow_of(self, state):
+        return self.follow_states[self.follow_offsets[state]:self.follow_offsets[state + 1]]
+
+    def enum_states(self):
+        return set(range(self.n_states))
+
+    def match(self, s):
+        alphabet = self.alphabet
+        states = self.start_states
+        for c in s:
+            cls = alphabet[c]
+            next_states = set()
+            for state in states:
+                if cls in self.classes_of(state):
+                    next_states.update(self.follow_of(state))
+            if not next_states:
+                return False
+            states = next_states
+        return self.accept in states
+
+    def fullmatch(self, s):
+        return self.match(s)
+
+    def to_dfa(self, max_states=None, max_work=None, deadline=None):
+        # subset construction over int bitsets of state ids. One sweep
+        # over a subset ORs the follow sets of its states, as bitsets
+        # built on first use, into one buffer per class reused for every
+        # subset; max_work bounds the number of NFA states swept in total,
+        # as in DFA.from_nfa, and deadline (a time.perf_counter() value)
+        # the time spent
+        dfa = DFA()
+        dfa.alphabet = self.alphabet
+        dfa.init_state = DFAState(0)
+        reads = [None] * self.n_states
+        merged = [0] * self.n_classes
+        touched = []
+        start = to_mask(self.start_states)
+        dfas = {start: dfa.init_state}
+        stack = [start]
+        work = 0
+        while stack:
+            states = stack.pop()
+            state = dfas[states]
+            members = bits(states)
+            if max_work is not None:
+                work += len(members)
+                if work > max_work:
+                    raise TooManyStates('DFA construction needs more than %d steps' % max_work)
+            if deadline is not None and time.perf_counter() > deadline:
+                raise CompileTimeout('DFA construction ran out of time with %d states' % len(dfas))
+            for nfa_state in members:
+                if reads[nfa_state] is None:
+                    if self.targets[nfa_state] < 0:
+                        continue
+                    reads[nfa_state] = (self.classes_of(nfa_state).tolist(), to_mask(self.follow_of(nfa_state)))
+                classes, follow = reads[nfa_state]
+                for cls in classes:
+                    if not merged[cls]:
+                        touched.append(cls)
+                    merged[cls] |= follow
+            for cls in touched:
+                next_states = merged[cls]
+                merged[cls] = 0
+                if next_states not in dfas:
+                    dfas[next_states] = DFAState(len(dfas))
+                    stack.append(next_states)
+                    if max_states is not None and len(dfas) > max_states:
+                        raise TooManyStates('DFA has more than %d states' % max_states)
+                state.transitions[cls] = dfas[next_states]
+            touched.clear()
+        dfa.accept_states = {state for states, state in dfas.items() if states >> self.accept & 1}
+        return dfa
+
+class CompactNFABuilder:
+    def __init__(self, ast, utf8=False):
+        # classes: chars (or with utf8, bytes) belonging to exactly the same
+        # CharNode char sets (or byte ranges)
+        char_sets = syntax.char_sets(ast)
+        self.sequences = None
+        if utf8:
+            self.sequences = {intervals: charset.utf8_sequences(intervals) for intervals in char_sets}
+            char_sets = [(byte_range,) for sequences in self.sequences.values()
+                         for sequence in sequences for byte_range in sequence]
+        self.alphabet, self.n_classes, self.set_classes = charset.classes(char_sets)
+        self.targets = []
+        self.reads = []
+        self.eps = []
+
+    def new_state(self):
+        self.targets.append(-1)
+        self.reads.append(None)
+        self.eps.append([])
+        return len(self.targets) - 1
+
+    def build(self, ast_node):
+        # returns the (start, end) states of the fragment for ast_node
+        type2method = {
+            syntax.EpsilonNode :        self.build_epsilon,
+            syntax.CharNode :           self.build_char,
+            syntax.ConcatenationNode :  self.build_concatenation,
+            syntax.UnionNode :          self.build_union,
+            syntax.QuantificationNode : self.build_quantification,
+            }
+        return type2method[type(ast_node)](ast_node)
+
+    def build_epsilon(self, ast_node):
+        state = self.new_state()
+        return state, state
+
+    def build_char(self, ast_node):
+        start = self.new_state()
+        end = self.new_state()
+        if self.sequences is None:
+            self.targets[start] = end
+            self.reads[start] = self.set_classes[ast_node.intervals]
+            return start, end
+        # one chain of byte reads per sequence, sharing common suffixes
+        chains = {}
+        heads = {}
+        for sequence in self.sequences[ast_node.intervals]:
+            state = end
+            for byte_range in reversed(sequence):
+                key = (byte_range, state)
+                if key not in chains:
+                    chains[key] = self.new_state()
+                    self.targets[chains[key]] = state
+                    self.reads[chains[key]] = self.set_classes[(byte_range,)]
+                state = chains[key]
+            heads[state] = None
+        self.eps[start].extend(heads)
+        return start, end
+
+    def build_concatenation(self, ast_node):
+        start, end = self.build_epsilon(None)
+        for child in ast_node.children:
+            child_start, child_end = self.build(child)
+            self.eps[end].append(child_start)
+            end = child_end
+        return start, end
+
+    def build_union(self, ast_node):
+        start = self.new_state()
+        end = self.new_state()
+        for child in ast_node.children:
+            child_start, child_end = self.build(child)
+            self.eps[start].append(child_start)
+            self.eps[child_end].append(end)
+        return start, end
+
+    def build_quantification(self, ast_node):
+        # unrolled like NFA.from_quantification_ast_node
+        start, end = self.build_epsilon(None)
+        for _ in range(ast_node.lb):
+            child_start, child_end = self.build(ast_node.operand)
+            self.eps[end].append(child_start)
+            end = child_end
+        if ast_node.ub < float('inf'):
+            for _ in range(ast_node.lb, ast_node.ub):
+                child_start, child_end = self.build(ast_node.operand)
+                self.eps[end].append(child_start)
+                self.eps[child_start].append(child_end)
+                end = child_end
+        else:
+            child_start, child_end = self.build(ast_node.operand)
+            loop_end = self.new_state()
+            self.eps[end].append(child_start)
+            self.eps[end].append(loop_end)
+            self.eps[child_end].append(child_start)
+            self.eps[child_end].append(loop_end)
+            end = loop_end
+        return start, end
+
+    def freeze(self, start, accept):
+        read_offsets, read_classes = csr([sorted(classes or ()) for classes in self.reads])
+        eps_offsets, eps_targets = csr(self.eps)
+        return CompactNFA(self.alphabet, self.n_classes, len(self.targets), start, accept,
+                          array('i', self.targets), read_offsets, read_classes, eps_offsets, eps_targets)
+
+def csr(rows):
+    # list of lists of ints to (offsets, values) arrays
+    offsets = array('i', [0])
+    values = array('i')
+    for row in rows:
+        values.extend(row)
+        offsets.append(len(values))
+    return offsets, values
+
+def epsilon_closures(successors, important=None):
+    # Epsilon closures of all states at once: successors[state] lists the
+    # epsilon targets of state, and closures only keep the states for
+    # which important[state] is true (all if important is None). Tarjan's algorithm
+    # finds the strongly connected components in reverse topological
+    # order, so when a component is complete the closures of all the
+    # components it reaches are known, and its closure is the union of
+    # those and of its own states, shared by all its states. A component
+    # adding nothing to the single closure it reaches reuses that very
+    # tuple, so chains of epsilon edges cost no copies. Returns a list of
+    # sorted tuples, iteratively so deep NFAs do not hit the recursion
+    # limit.
+    n_states = len(successors)
+    index = [-1] * n_states
+    low = [0] * n_states
+    on_stack = [False] * n_states
+    closures = [None] * n_states
+    component = []
+    counter = 0
+    for root in range(n_states):
+        if index[root] >= 0:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        component.append(root)
+        on_stack[root] = True
+        # the states being explored, with how many of their successors are
+        work = [root]
+        explored = [0]
+        while work:
+            state = work[-1]
+            dests = successors[state]
+            i = explored[-1]
+            if i < len(dests):
+                explored[-1] = i + 1
+                dest = dests[i]
+                if index[dest] < 0 and not successors[dest]:
+                    # a component of its own, done at once
+                    index[dest] = counter
+                    counter += 1
+                    closures[dest] = (dest,) if important is None or important[dest] else ()
+                elif index[dest] < 0:
+                    index[dest] = low[dest] = counter
+                    counter += 1
+                    component.append(dest)
+                    on_stack[dest] = True
+                    work.append(dest)
+                    explored.append(0)
+                elif on_stack[dest] and index[dest] < low[state]:
+                    low[state] = index[dest]
+                continue
+            work.pop()
+            explored.pop()
+            if work and low[state] < low[work[-1]]:
+                low[work[-1]] = low[state]
+            if low[state] != index[state]:
+                continue
+            members = []
+            while True:
+                member = component.pop()
+                on_stack[member] = False
+                members.append(member)
+                if member == state:
+                    break
+            # reached components are complete, members are still None
+            reached = {}
+            for member in members:
+                for dest in successors[member]:
+                    closure = closures[dest]
+                    if closure is not None:
+                        reached[id(closure)] = closure
+            own = members if important is None else [member for member in members if important[member]]
+            if not own and len(reached) == 1:
+                closure = next(iter(reached.values()))
+            elif not reached:
+                closure = tuple(sorted(own))
+            else:
+                closure = set(own)
+                for reached_closure in reached.values():
+                    closure.update(reached_closure)
+                closure = tuple(sorted(closure))
+            for member in members:
+                closures[member] = closure
+    return closures
+
+def to_mask(states):
+    mask = 0
+    for state in states:
+        mask |= 1 << state
+    return mask
+
+def bits(mask):
+    # indices of the set bits of mask, in increasing order; scanning the
+    # binary string is much faster than shifting a long int bit by bit
+    digits = bin(mask)
+    top = len(digits) - 1
+    indices = []
+    i = digits.find('1', 2)
+    while i >= 0:
+        indices.append(top - i)
+        i = digits.find('1', i + 1)
+    indices.reverse()
+    return indices
+
 class DFAState:
     def __init__(self, _id):
         self.id = _id
@@ -168,9 +538,18 @@ class DFAState:
         return out
 
 class DFA: # Deterministic Finite Automaton
+    # Transitions are on class numbers, as in the NFA it is built from:
+    # alphabet maps chars to them. utf8 is the table.TableDFA reading the
+    # UTF-8 encoding of bytes-like input, if it differs from this one.
     def __init__(self):
         self.init_state = None
         self.accept_states = set()
+        self.alphabet = None
+        self.table_dfa = None
+        self.prefilter = None
+        self.utf8 = None
+        self.search_limits = None
+        self.match_counters = None
 
     def __str__(self):
         out = '[init: %s, accept: %s]\n' % \
@@ -181,44 +560,155 @@ class DFA: # Deterministic Finite Automaton
         return out
 
     def match(self, s):
+        if not isinstance(s, str):
+            # bytes-like input is matched on the table form
+            return self.compiled().match(s)
+        alphabet = self.alphabet
         state = self.init_state
         for c in s:
-            if c not in state.transitions:
+            char_class = alphabet[c]
+            if char_class not in state.transitions:
                 return False
-            state = state.transitions[c]
+            state = state.transitions[char_class]
         if state in self.accept_states:
             return True
         else:
             return False
 
-    @classmethod
-    def merge_transitions(cls, transitions):
-        merged = defaultdict(set)
-        for transition in transitions:
-            for char, dest_states in transition.items():
-                merged[char] |= dest_states
-        return merged
+    def fullmatch(self, s):
+        return self.match(s)
+
+    # search, finditer and findall run on the table form of this DFA,
+    # see table.py
+    def compiled(self):
+        if self.table_dfa is None:
+            self.table_dfa = table.TableDFA.from_dfa(self)
+            self.table_dfa.prefilter = self.prefilter
+            self.table_dfa.utf8 = self.utf8
+            self.table_dfa.search_limits = self.search_limits
+            self.table_dfa.match_counters = self.match_counters
+        return self.table_dfa
+
+    def match_many(self, strings, lengths=None):
+        return self.compiled().match_many(strings, lengths)
+
+    def search(self, s):
+        return self.compiled().search(s)
+
+    def finditer(self, s):
+        return self.compiled().finditer(s)
+
+    def findall(self, s):
+        return self.compiled().findall(s)
+
+    def stream(self):
+        return self.compiled().stream()
+
+    def save(self, path):
+        self.compiled().save(path)
 
     @classmethod
-    def from_nfa(cls, nfa):
+    def from_nfa(cls, nfa, max_states=None, max_work=None):
+        # Subset construction over int bitsets of the state ids of an
+        # epsilon-eliminated NFA, merging transitions into one buffer
+        # reused for every subset, like CompactNFA.to_dfa. max_work bounds
+        # the number of NFA transitions merged in total, which is what the
+        # running time is proportional to
         dfa = DFA()
-        nfas2dfas = defaultdict(lambda: DFAState(len(nfas2dfas)))
-        init_nfas = frozenset(nfa.init_state.epsilon_set)
+        dfa.alphabet = nfa.alphabet
+        nfa_states = sorted(nfa.enum_states(), key=lambda state: state.id)
+        transitions = [None] * len(nfa_states)
+        merged = {}
+        init_nfas = to_mask([state.id for state in nfa.init_state.epsilon_set])
+        dfa.init_state = DFAState(0)
+        nfas2dfas = {init_nfas: dfa.init_state}
         stack = [init_nfas]
-        dfa.init_state = nfas2dfas[init_nfas]
-        done_nfas = set()
+        work = 0
         while stack:
             nfas = stack.pop(-1)
-            if nfas in done_nfas:
-                continue
-            done_nfas.add(nfas)
-            transitions = DFA.merge_transitions([state.transitions for state in nfas])
             dfas = nfas2dfas[nfas]
-            for char, next_nfas in transitions.items():
-                next_nfas = frozenset(next_nfas)
+            for nfa_state in bits(nfas):
+                if transitions[nfa_state] is None:
+                    transitions[nfa_state] = [(char, to_mask([dest.id for dest in dests]))
+                                              for char, dests in nfa_states[nfa_state].transitions.items() if dests]
+                work += len(transitions[nfa_state])
+                for char, dests in transitions[nfa_state]:
+                    merged[char] = merged.get(char, 0) | dests
+            if max_work is not None and work > max_work:
+                raise TooManyStates('DFA construction needs more than %d steps' % max_work)
+            for char, next_nfas in merged.items():
+                if next_nfas not in nfas2dfas:
+                    nfas2dfas[next_nfas] = DFAState(len(nfas2dfas))
+                    stack.append(next_nfas)
                 dfas.transitions[char] = nfas2dfas[next_nfas]
-                stack.append(next_nfas)
-        dfa.accept_states = {dfas for nfas, dfas in nfas2dfas.items() if nfa.accept_state in nfas}
+            merged.clear()
+            if max_states is not None and len(nfas2dfas) > max_states:
+                raise TooManyStates('DFA has more than %d states' % max_states)
+        accept = nfa.accept_state.id
+        dfa.accept_states = {dfas for nfas, dfas in nfas2dfas.items() if nfas >> accept & 1}
+        return dfa
+
+    def minimize(self):
+        # Hopcroft's partition refinement. Missing transitions go to an
+        # implicit dead state represented by None.
+        states = list(self.enum_states()) + [None]
+        alphabet = set()
+        for state in states[:-1]:
+            alphabet |= state.transitions.keys()
+        inverse = {char: defaultdict(set) for char in alphabet}
+        for state in states:
+            for char in alphabet:
+                dest = state.transitions.get(char) if state else None
+                inverse[char][dest].add(state)
+
+        accepting = {state for state in states if state in self.accept_states}
+        rejecting = {state for state in states if state not in self.accept_states}
+        blocks = [block for block in (accepting, rejecting) if block]
+        block_of = {}
+        for i, block in enumerate(blocks):
+            for state in block:
+                block_of[state] = i
+        worklist = {min(range(len(blocks)), key=lambda i: len(blocks[i]))}
+        while worklist:
+            splitter = list(blocks[worklist.pop()])
+            for char in alphabet:
+                touched = defaultdict(set)
+                for state in splitter:
+                    for pred in inverse[char].get(state, ()):
+                        touched[block_of[pred]].add(pred)
+                for i, inside in touched.items():
+                    if len(inside) == len(blocks[i]):
+                        continue
+                    blocks[i] -= inside
+                    new_i = len(blocks)
+                    blocks.append(inside)
+                    for state in inside:
+                        block_of[state] = new_i
+                    if i in worklist or len(inside) <= len(blocks[i]):
+                        worklist.add(new_i)
+                    else:
+                        worklist.add(i)
+
+        dfa = DFA()
+        dfa.alphabet = self.alphabet
+        dead_i = block_of[None]
+        block2dfas = {}
+        stack = [block_of[self.init_state]]
+        block2dfas[stack[0]] = DFAState(0)
+        while stack:
+            i = stack.pop(-1)
+            representative = next(iter(blocks[i]))
+            for char, dest in representative.transitions.items():
+                dest_i = block_of[dest]
+                if dest_i == dead_i:
+                    continue
+                if dest_i not in block2dfas:
+                    block2dfas[dest_i] = DFAState(len(block2dfas))
+                    stack.append(dest_i)
+                block2dfas[i].transitions[char] = block2dfas[dest_i]
+        dfa.init_state = block2dfas[block_of[self.init_state]]
+        dfa.accept_states = {block2dfas[block_of[state]] for state in self.accept_states
+                             if block_of[state] in block2dfas}
         return dfa
 
     def enum_states(self):
@@ -232,3 +722,198 @@ class DFA: # Deterministic Finite Automaton
             for next_state in state.transitions.values():
                 stack.append(next_state)
         return states
+
+class SparseSet: # set of ints below size, with O(1) add and clear
+    def __init__(self, size):
+        self.dense = [0] * size
+        self.sparse = [0] * size
+        self.size = 0
+
+    def __contains__(self, x):
+        i = self.sparse[x]
+        return i < self.size and self.dense[i] == x
+
+    def __iter__(self):
+        return iter(self.dense[:self.size])
+
+    def add(self, x):
+        if x not in self:
+            self.sparse[x] = self.size
+            self.dense[self.size] = x
+            self.size += 1
+
+    def clear(self):
+        self.size = 0
+
+class PikeVM: # simulation of an epsilon-eliminated NFA over state ids
+    # Active states are kept in two preallocated sparse sets that are
+    # swapped after each character, so matching allocates nothing and
+    # takes O(len(s) * #states) time whatever the pattern. Sparse sets
+    # keep insertion order, i.e. states are visited in a fixed order.
+    # Each thread gets its own pair, as cached matchers are shared.
+    def __init__(self, n_states, transitions, start, accept, alphabet):
+        self.n_states = n_states
+        self.transitions = transitions
+        self.start = start
+        self.accept = accept
+        self.alphabet = alphabet
+        self.scratch = threading.local()
+
+    def __str__(self):
+        out = '[init: %s, accept: %d]\n' % ('|'.join([str(state) for state in self.start]), self.accept)
+        for state, transitions in enumerate(self.transitions):
+            out += '%d: {%s}\n' % (state, ', '.join(['%s->%s' % (char, '|'.join([str(dest) for dest in dests]))
+                                                     for char, dests in transitions.items()]))
+        return out
+
+    @classmethod
+    def from_nfa(cls, nfa):
+        # nfa must have gone through epsilon_elimination(), whose numbering
+        # gives the state ids
+        states = sorted(nfa.enum_states(), key=lambda state: state.id)
+        transitions = [{char: tuple(sorted([dest.id for dest in dests]))
+                        for char, dests in state.transitions.items() if dests}
+                       for state in states]
+        start = tuple(sorted([state.id for state in nfa.init_state.epsilon_set]))
+        return PikeVM(len(states), transitions, start, nfa.accept_state.id, nfa.alphabet)
+
+    def enum_states(self):
+        return set(range(self.n_states))
+
+    def match(self, s):
+        charset.require_str(s, 'the nfa engine')
+        transitions = self.transitions
+        alphabet = self.alphabet
+        scratch = self.scratch
+        if not hasattr(scratch, 'current'):
+            scratch.current = SparseSet(self.n_states)
+            scratch.next = SparseSet(self.n_states)
+        current = scratch.current
+        next_ = scratch.next
+        current.clear()
+        for state in self.start:
+            current.add(state)
+        for c in s:
+            char_class = alphabet[c]
+            dense = next_.dense
+            sparse = next_.sparse
+            size = 0
+            current_dense = current.dense
+            for i in range(current.size):
+                for dest in transitions[current_dense[i]].get(char_class, ()):
+                    j = sparse[dest]
+                    if j < size and dense[j] == dest:
+                        continue
+                    sparse[dest] = size
+                    dense[size] = dest
+                    size += 1
+            next_.size = size
+            if size == 0:
+                return False
+            current, next_ = next_, current
+        return self.accept in current
+
+    def fullmatch(self, s):
+        return self.match(s)
+
+class LazyDFA: # DFA whose states are built on demand while matching
+    def __init__(self, nfa, max_states=1000, min_scan_per_state=10, max_bad_flushes=3, unanchored=False):
+        # unanchored adds the initial NFA states back after every step, as
+        # if the pattern started with .*
+        self.nfa = nfa
+        self.unanchored = unanchored
+        self.start_nfas = frozenset(nfa.init_state.epsilon_set)
+        self.max_states = max_states
+        self.min_scan_per_state = min_scan_per_state
+        self.max_bad_flushes = max_bad_flushes
+        self.states = {}
+        self.flushes = 0
+        self.cache_misses = 0
+        self.bad_flushes = 0
+        self.scanned = 0
+        self.scanned_at_flush = 0
+        self.thrashing = False
+        self.init_state = self.get_state(self.start_nfas)
+
+    def __str__(self):
+        out = '[init: %s, accept: %s, flushes: %d]\n' % \
+            (str(self.init_state.id),
+             '|'.join([str(state.id) for state in self.states.values() if state.accept]),
+             self.flushes)
+        for state in self.enum_states():
+            out += str(state) + '\n'
+        return out
+
+    @classmethod
+    def from_nfa(cls, nfa, max_states=1000):
+        return LazyDFA(nfa, max_states=max_states)
+
+    def enum_states(self):
+        return set(self.states.values())
+
+    def get_state(self, nfas):
+        if nfas in self.states:
+            return self.states[nfas]
+        state = DFAState(len(self.states))
+        state.nfa_states = nfas
+        state.accept = self.accepting(nfas)
+        self.states[nfas] = state
+        return state
+
+    def accepting(self, nfas):
+        return self.nfa.accept_state in nfas
+
+    def flush(self, scanned):
+        # Same heuristic as RE2: if the cache could not even last for a few
+        # characters per state, building states costs more than simulating
+        # the NFA, so give up on the DFA for good after a few such flushes.
+        if scanned - self.scanned_at_flush < self.min_scan_per_state * self.max_states:
+            self.bad_flushes += 1
+            if self.bad_flushes > self.max_bad_flushes:
+                self.thrashing = True
+        self.flushes += 1
+        self.scanned_at_flush = scanned
+        self.states = {}
+        self.init_state = self.get_state(self.start_nfas)
+
+    def add_transition(self, state, char_class, scanned):
+        # transitions of the lazy states are on char classes, so that
+        # their number does not grow with the distinct chars of the input
+        self.cache_misses += 1
+        next_nfas = set()
+        for nfa_state in state.nfa_states:
+            next_nfas.update(nfa_state.transitions.get(char_class, ()))
+        if self.unanchored:
+            next_nfas |= self.start_nfas
+        if not next_nfas:
+            next_state = None
+        else:
+            next_nfas = frozenset(next_nfas)
+            if next_nfas not in self.states and len(self.states) >= self.max_states:
+                self.flush(scanned)
+            next_state = self.get_state(next_nfas)
+        # state may already be gone from the cache after a flush, in which
+        # case this link just dies with it.
+        state.transitions[char_class] = next_state
+        return next_state
+
+    def match(self, s):
+        charset.require_str(s, 'the lazy engine')
+        if self.thrashing:
+            return self.nfa.match(s)
+        alphabet = self.nfa.alphabet
+        state = self.init_state
+        for pos, c in enumerate(s):
+            char_class = alphabet[c]
+            if char_class in state.transitions:
+                state = state.transitions[char_class]
+            else:
+                state = self.add_transition(state, char_class, self.scanned + pos)
+                if self.thrashing and state is not None:
+                    self.scanned += pos + 1
+                    return self.nfa.match(s[(pos+1):], state.nfa_states)
+            if state is None:
+                self.scanned += pos + 1
+                return False
+        self.scanned += len(s)
+        return state.accept
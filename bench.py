@@ -0,0 +1,193 @@
+# Benchmarks of the engines in regex.py against the standard re module.
+#
+# Every pattern of every family is compiled by every engine, then matched
+# (as fullmatch) against every line of generated inputs of several sizes.
+# For each (pattern, engine, input size) we record compile time, peak
+# memory while compiling (tracemalloc, in a separate run so that it does
+# not slow down the timed one), DFA state count where there is one, the
+# number of matching lines and the throughput in MB/s. Times are the best
+# of several runs. Results are written as JSON with sorted keys, one
+# record per line of the results list, so that runs on two commits can be
+# diffed.
+#
+#   $ python3 bench.py --output before.json
+#   $ python3 bench.py --sizes 1000 --families literal,alternation
+
+import regex
+
+import argparse
+import json
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+SIZES = [10000, 100000]
+REPEAT = 3
+ENGINES = ['auto', 'table', 'lazy', 'nfa', 'bitparallel', 're']
+
+# compiles exceeding these are recorded as errors rather than waited for;
+# they do not make the compile build the search DFAs, which matching
+# whole lines never needs, so the plain compile is what gets measured
+MAX_COMPILE_TIME = 10.0
+MAX_DFA_STATES = 100000
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliett',
+         'kilo', 'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango']
+
+def random_string(rng, chars, lb, ub):
+    return ''.join([rng.choice(chars) for _ in range(rng.randint(lb, ub))])
+
+def literal_lines(rng):
+    return rng.choice(['GET /index.html', 'GET /about.html', 'POST /index.html',
+                       random_string(rng, 'abcdefghij /.', 5, 20)])
+
+def alternation_lines(rng):
+    word = rng.choice(WORDS) + str(rng.randint(0, 60))
+    return word if rng.random() < 0.5 else word + 'x'
+
+def nested_lines(rng):
+    return random_string(rng, 'abc', 5, 40) + rng.choice(['d', ''])
+
+def counted_lines(rng):
+    return 'x' + random_string(rng, 'abcdefghijklmnopqrstuvwxyz', 0, 80) + rng.choice(['y', 'z'])
+
+def blowup_lines(rng):
+    return random_string(rng, 'ab', 10, 60)
+
+def dot_lines(rng):
+    return random_string(rng, 'abcdefghij ', 0, 20) + rng.choice(['foo', 'fo']) + \
+        random_string(rng, 'abcdefghij ', 0, 20) + rng.choice(['bar', 'baz']) + random_string(rng, 'abcdefghij ', 0, 20)
+
+# family: (patterns, generator of one input line)
+FAMILIES = {
+    'literal': (['GET /index.html', 'GET /[a-z]+.html'], literal_lines),
+    'alternation': (['(%s)[0-9]*' % '|'.join(['%s%d' % (word, i) for word in WORDS for i in range(50)]),
+                     '(%s)[0-9]+' % '|'.join(WORDS)], alternation_lines),
+    'nested': (['((a|b)*c)+d', '(a+b+)*c*d?', '((ab?)*(ba?)*)*c?'], nested_lines),
+    'counted': (['x[a-z]{0,80}y', 'x[a-z]{10,20}[a-z]*z', 'x([a-c]|[d-z]){0,40}y'], counted_lines),
+    'blowup': (['(a|b)*a(a|b){8}', '(a|b)*a(a|b){16}'], blowup_lines),
+    'dot': (['.*foo.*bar.*', '.*fo.*ba[rz].*', '.{0,20}foo.{0,20}bar.*'], dot_lines),
+    }
+
+def make_lines(generator, size, seed):
+    rng = random.Random(seed)
+    lines = []
+    n_bytes = 0
+    while n_bytes < size:
+        line = generator(rng)
+        lines.append(line)
+        n_bytes += len(line) + 1
+    return lines
+
+def compile_pattern(pattern, engine):
+    if engine == 're':
+        re.purge()
+        return re.compile(pattern)
+    return regex.compile_regex(pattern, engine=engine, cache=False,
+                               max_compile_time=MAX_COMPILE_TIME, max_dfa_states=MAX_DFA_STATES)
+
+def count_matches(matcher, engine, lines):
+    if engine == 're':
+        fullmatch = matcher.fullmatch
+        return sum([1 for line in lines if fullmatch(line)])
+    if hasattr(matcher, 'match_many'):
+        return sum([1 for matched in matcher.match_many(lines) if matched])
+    match = matcher.match
+    return sum([1 for line in lines if match(line)])
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        before = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - before
+        if best is None or elapsed < best:
+            best = elapsed
+        # slow runs are not repeated
+        if elapsed > 1.0:
+            break
+    return best, result
+
+def bench_compile(pattern, engine, repeat):
+    compile_time, matcher = best_time(lambda: compile_pattern(pattern, engine), repeat)
+    tracemalloc.start()
+    compile_pattern(pattern, engine)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    record = {'compile_seconds': compile_time, 'compile_peak_bytes': peak}
+    stats = getattr(matcher, 'stats', {})
+    record['engine_used'] = stats.get('engine', engine)
+    if 'dfa_states' in stats:
+        record['dfa_states'] = stats['dfa_states']
+    return record, matcher
+
+def run(families=None, engines=ENGINES, sizes=SIZES, repeat=REPEAT, seed=0, log=None):
+    results = []
+    for family in families or sorted(FAMILIES):
+        patterns, generator = FAMILIES[family]
+        inputs = [(size, make_lines(generator, size, seed)) for size in sizes]
+        for pattern in patterns:
+            for engine in engines:
+                base = {'family': family, 'pattern': pattern, 'engine': engine}
+                try:
+                    compile_record, matcher = bench_compile(pattern, engine, repeat)
+                except (regex.CompileLimitError, regex.bitparallel.TooManyPositions) as e:
+                    results.append(dict(base, error=str(e)))
+                    if log:
+                        print('%-12s %-12s %8s %13s %s' % (family, engine, '', 'error', pattern[:40]), file=log)
+                    continue
+                for size, lines in inputs:
+                    seconds, matches = best_time(lambda: count_matches(matcher, engine, lines), repeat)
+                    n_bytes = sum([len(line) + 1 for line in lines])
+                    record = dict(base, **compile_record)
+                    record.update({'input_bytes': n_bytes, 'lines': len(lines), 'matches': matches,
+                                   'match_seconds': seconds, 'mb_per_s': n_bytes / seconds / 1e6})
+                    results.append(record)
+                    if log:
+                        print('%-12s %-12s %8d %8.2f MB/s %s' % (family, engine, size, record['mb_per_s'], pattern[:40]),
+                              file=log)
+    return results
+
+def mismatches(results):
+    # (family, pattern, input_bytes) whose match counts differ between engines
+    counts = {}
+    for record in results:
+        if 'matches' in record:
+            key = (record['family'], record['pattern'], record['input_bytes'])
+            counts.setdefault(key, set()).add(record['matches'])
+    return sorted([key for key, values in counts.items() if len(values) > 1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark regex engines against re')
+    parser.add_argument('--output', help='JSON file to write, default stdout')
+    parser.add_argument('--families', help='comma separated subset of: ' + ', '.join(sorted(FAMILIES)))
+    parser.add_argument('--engines', default=','.join(ENGINES))
+    parser.add_argument('--sizes', default=','.join([str(size) for size in SIZES]),
+                        help='comma separated input sizes in bytes')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    families = args.families.split(',') if args.families else None
+    results = run(families, args.engines.split(','), [int(size) for size in args.sizes.split(',')],
+                  args.repeat, args.seed, log=sys.stderr)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+        'mismatches': [list(key) for key in mismatches(results)],
+        }
+    text = json.dumps(report, sort_keys=True, indent=1)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    for key in report['mismatches']:
+        print('engines disagree on %s' % (key,), file=sys.stderr)
+    return 1 if report['mismatches'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# Bit-parallel simulation of the Glushkov automaton of a pattern.
+#
+# Every CharNode occurrence in the (repetition-expanded) AST is a position
+# of the Glushkov automaton, with bit 0 standing for the initial state, so
+# a set of active states is a single int. From the AST we compute, for
+# every position, the mask of positions that may follow it, plus one mask
+# per character of the positions that read it (a charset.CharMap, filled
+# in as chars are met). One step is then
+#
+#   D' = follow(D) & char_masks[c]
+#
+# where follow(D), the union of the follow masks of the bits in D, is read
+# from precomputed tables covering chunk_bits bits of D at a time. No
+# subset construction is involved, so the cost only depends on the number
+# of positions, which is therefore limited.
+#
+# A counted repetition of a single char class, like [a-z]{1,1000}, is not
+# expanded into copies but becomes one counting position. Besides its bit
+# in D, a counting position keeps the set of repetition counts it may be
+# at as an int bitmask (bit k for k copies read), which is shifted left
+# on every char of the class. Positions after it only follow while some
+# count reaches the lower bound. Compile time and the number of positions
+# thus do not depend on the bounds.
+
+import charset
+import syntax
+
+MAX_POSITIONS = 64
+CHUNK_BITS = 12
+
+class TooManyPositions(Exception):
+    pass
+
+class Glushkov:
+    def __init__(self, max_positions):
+        self.max_positions = max_positions
+        self.follow = [0]
+        # (intervals, bit) of every position
+        self.reads = []
+        self.counters = []
+
+    def build(self, ast_node):
+        # returns (nullable, first, last) of ast_node
+        type2method = {
+            syntax.EpsilonNode :        self.build_epsilon,
+            syntax.CharNode :           self.build_char,
+            syntax.ConcatenationNode :  self.build_concatenation,
+            syntax.UnionNode :          self.build_union,
+            syntax.QuantificationNode : self.build_quantification,
+            }
+        return type2method[type(ast_node)](ast_node)
+
+    def add_follow(self, last, first):
+        position = 0
+        while last:
+            if last & 1:
+                self.follow[position] |= first
+            last >>= 1
+            position += 1
+
+    def build_epsilon(self, ast_node):
+        return True, 0, 0
+
+    def build_char(self, ast_node):
+        position = len(self.follow)
+        if position > self.max_positions:
+            raise TooManyPositions('pattern has more than %d positions' % self.max_positions)
+        self.follow.append(0)
+        bit = 1 << position
+        self.reads.append((ast_node.intervals, bit))
+        return False, bit, bit
+
+    def char_masks(self):
+        # chars to the mask of the positions reading them
+        starts, signatures = charset.partition([intervals for intervals, _ in self.reads])
+        masks = []
+        for signature in signatures:
+            mask = 0
+            for i in signature:
+                mask |= self.reads[i][1]
+            masks.append(mask)
+        return charset.CharMap(starts, masks)
+
+    def concatenate(self, left, right):
+        left_nullable, left_first, left_last = left
+        right_nullable, right_first, right_last = right
+        self.add_follow(left_last, right_first)
+        return (left_nullable and right_nullable,
+                left_first | (right_first if left_nullable else 0),
+                right_last | (left_last if right_nullable else 0))
+
+    def build_concatenation(self, ast_node):
+        result = self.build_epsilon(None)
+        for child in ast_node.children:
+            result = self.concatenate(result, self.build(child))
+        return result
+
+    def build_union(self, ast_node):
+        nullable, first, last = False, 0, 0
+        for child in ast_node.children:
+            child_nullable, child_first, child_last = self.build(child)
+            nullable = nullable or child_nullable
+            first |= child_first
+            last |= child_last
+        return nullable, first, last
+
+    def build_quantification(self, ast_node):
+        if is_counted(ast_node):
+            nullable, first, last = self.build_char(ast_node.operand)
+            self.counters.append((len(self.follow) - 1, ast_node.lb, ast_node.ub))
+            return ast_node.lb == 0, first, last
+        # expanded like NFA.from_quantification_ast_node, i.e. into lb
+        # copies followed by ub - lb optional copies, except that with an
+        # unbounded ub the last copy loops back on itself (so x+ is a
+        # single copy rather than x x*)
+        result = self.build_epsilon(None)
+        unbounded = ast_node.ub == float('inf')
+        n_required = ast_node.lb
+        if unbounded and n_required > 0:
+            n_required -= 1
+        for _ in range(n_required):
+            result = self.concatenate(result, self.build(ast_node.operand))
+        if unbounded:
+            nullable, first, last = self.build(ast_node.operand)
+            self.add_follow(last, first)
+            result = self.concatenate(result, (nullable or ast_node.lb == 0, first, last))
+        else:
+            for _ in range(ast_node.lb, ast_node.ub):
+                _, first, last = self.build(ast_node.operand)
+                result = self.concatenate(result, (True, first, last))
+        return result
+
+def is_counted(ast_node):
+    # repetitions of a single char class that would otherwise take more
+    # than one position
+    if type(ast_node.operand) != syntax.CharNode:
+        return False
+    if ast_node.ub == float('inf'):
+        return ast_node.lb > 1
+    return ast_node.ub > 1
+
+class BitParallelMatcher:
+    def __init__(self, n_positions, char_masks, follow, accept_mask, chunk_bits=CHUNK_BITS, counters=()):
+        # counters: (position, lb, ub) of every counting position
+        self.n_positions = n_positions
+        self.char_masks = char_masks
+        self.accept_mask = accept_mask
+        self.counters = list(counters)
+        self.chunk_bits = min(chunk_bits, n_positions + 1)
+        self.tables = []
+        for base in range(0, n_positions + 1, self.chunk_bits):
+            chunk = follow[base:(base + self.chunk_bits)]
+            table = [0]
+            for bit_mask in chunk:
+                table += [mask | bit_mask for mask in table]
+            self.tables.append(table)
+
+    def __str__(self):
+        out = '[positions: %d, accept: %s]\n' % (self.n_positions, bin(self.accept_mask))
+        for first, last, mask in self.char_masks.segments():
+            if mask:
+                out += '%s: %s\n' % (charset.to_str([(first, last)]), bin(mask))
+        return out
+
+    @classmethod
+    def from_ast(cls, ast, max_positions=MAX_POSITIONS):
+        glushkov = Glushkov(max_positions)
+        nullable, first, last = glushkov.build(ast)
+        glushkov.follow[0] = first
+        accept_mask = last | (1 if nullable else 0)
+        return BitParallelMatcher(len(glushkov.follow) - 1, glushkov.char_masks(), glushkov.follow, accept_mask,
+                                  counters=glushkov.counters)
+
+    def match(self, s):
+        return self.match_many([s])[0]
+
+    def fullmatch(self, s):
+        return self.match(s)
+
+    def match_many(self, strings):
+        # all lines in one call, so the setup below is paid once
+        strings = [charset.require_str(s, 'the bitparallel engine') for s in strings]
+        if self.counters:
+            return [self.match_counting(s) for s in strings]
+        char_masks = self.char_masks
+        accept_mask = self.accept_mask
+        results = []
+        if len(self.tables) == 1:
+            table = self.tables[0]
+            for s in strings:
+                state = 1
+                for c in s:
+                    state = table[state] & char_masks[c]
+                    if not state:
+                        break
+                results.append((state & accept_mask) != 0)
+            return results
+        chunk_bits = self.chunk_bits
+        chunk_mask = (1 << chunk_bits) - 1
+        if len(self.tables) == 2:
+            low, high = self.tables
+            for s in strings:
+                state = 1
+                for c in s:
+                    state = (low[state & chunk_mask] | high[state >> chunk_bits]) & char_masks[c]
+                    if not state:
+                        break
+                results.append((state & accept_mask) != 0)
+            return results
+        tables = [(i * chunk_bits, table) for i, table in enumerate(self.tables)]
+        for s in strings:
+            state = 1
+            for c in s:
+                follow = 0
+                for shift, table in tables:
+                    follow |= table[(state >> shift) & chunk_mask]
+                state = follow & char_masks[c]
+                if not state:
+                    break
+            results.append((state & accept_mask) != 0)
+        return results
+
+    def follow_of(self, state):
+        chunk_mask = (1 << self.chunk_bits) - 1
+        follow = 0
+        for i, table in enumerate(self.tables):
+            follow |= table[(state >> (i * self.chunk_bits)) & chunk_mask]
+        return follow
+
+    def match_counting(self, s):
+        # counts[i] is the set of repetition counts of the i-th counter
+        char_masks = self.char_masks
+        counters = [(1 << position, lb, ub) for position, lb, ub in self.counters]
+        counts = [0] * len(counters)
+        state = 1
+        for c in s:
+            char_mask = char_masks[c]
+            next_state = self.follow_of(self.leaving(state, counters, counts)) & char_mask
+            for i, (bit, lb, ub) in enumerate(counters):
+                count = 0
+                if char_mask & bit:
+                    if state & bit:
+                        count = counts[i] << 1
+                        if ub == float('inf'):
+                            # counts beyond lb are all the same
+                            count = (count | (counts[i] & (1 << lb))) & ((2 << lb) - 1)
+                        else:
+                            count &= (2 << ub) - 1
+                    if next_state & bit:
+                        # entered from a preceding position
+                        count |= 2
+                counts[i] = count
+                if count:
+                    next_state |= bit
+                else:
+                    next_state &= ~bit
+            state = next_state
+            if not state:
+                return False
+        return (self.leaving(state, counters, counts) & self.accept_mask) != 0
+
+    def leaving(self, state, counters, counts):
+        # state without the counting positions that have not reached lb
+        for i, (bit, lb, ub) in enumerate(counters):
+            if state & bit and not counts[i] >> lb:
+                state &= ~bit
+        return state
@@ -0,0 +1,340 @@
+# Submatch extraction with a tagged NFA, simulated like automata.PikeVM.
+#
+# The NFA is built from an AST parsed with syntax.parse(captures=True).
+# Every GroupNode adds two tag states around its operand, which record
+# the current position in the slots 2 * index and 2 * index + 1 (group 0
+# being the whole match). Each active thread, i.e. NFA state reading a
+# char, owns its slot values, and they are copied along epsilon paths
+# when the next set of threads is built. Threads are kept in priority
+# order (earlier alternatives and more repetitions first), and a state
+# reached by two paths keeps the one of higher priority only, in
+# O(len(s) * #states) time.
+#
+# The spans found are those a backtracking matcher like re would report,
+# except after an empty iteration. A state is visited once per position,
+# so a loop that comes back to its start without reading anything is
+# cut: *, + and {m,} never take an empty iteration beyond the m they
+# need. re takes one last empty iteration when the operand can match
+# empty there, and reports the groups it sets, e.g. (a|)* on 'aa' gives
+# group 1 (2, 2) with re and (1, 2) here, and ((a)*)* on '' gives group
+# 1 (0, 0) with re and None here. Slots live in two preallocated arrays, one
+# row per state, which are swapped after each char like the sparse sets
+# of PikeVM. These and the other buffers are allocated once per thread,
+# see Scratch.
+#
+# search() and finditer() find leftmost-longest matches, like
+# table.TableDFA, in one pass: a new thread starts at every position
+# until some match is found, threads stay ordered by start position, and
+# the scan stops when no thread that started at or before the leftmost
+# match is left.
+
+import automata
+import charset
+import syntax
+import threading
+
+class CaptureMatcher:
+    def __init__(self, alphabet, n_groups, reads, targets, eps, saves, start, accept):
+        # reads[state]: char classes (see charset.classes()) read by state,
+        # or None for an epsilon state, which goes to the states
+        # eps[state] in priority order, after setting slot saves[state] if
+        # it is not -1
+        self.alphabet = alphabet
+        self.n_groups = n_groups
+        self.n_slots = 2 * (n_groups + 1)
+        self.n_states = len(reads)
+        self.reads = reads
+        self.targets = targets
+        self.eps = eps
+        self.saves = saves
+        self.start = start
+        self.accept = accept
+        self.local = threading.local()
+
+    def __str__(self):
+        out = '[groups: %d, start: %d, accept: %d]\n' % (self.n_groups, self.start, self.accept)
+        for state in range(self.n_states):
+            if self.reads[state] is not None:
+                out += '%d: %s->%d\n' % (state, '|'.join([str(cls) for cls in sorted(self.reads[state])]),
+                                         self.targets[state])
+            else:
+                save = ' save %d' % self.saves[state] if self.saves[state] >= 0 else ''
+                out += '%d:%s ->%s\n' % (state, save, '|'.join([str(dest) for dest in self.eps[state]]))
+        return out
+
+    @classmethod
+    def from_ast(cls, ast):
+        builder = CaptureNFABuilder(ast)
+        start, end = builder.build(syntax.GroupNode(0, ast))
+        accept = builder.new_state()
+        builder.eps[end].append(accept)
+        return CaptureMatcher(builder.alphabet, builder.n_groups, builder.reads, builder.targets, builder.eps, builder.saves,
+                              start, accept)
+
+    def enum_states(self):
+        return set(range(self.n_states))
+
+    def scratch(self):
+        # the buffers of the calling thread, as cached matchers are shared
+        scratch = getattr(self.local, 'scratch', None)
+        if scratch is None:
+            scratch = self.local.scratch = Scratch(self.n_states, self.n_slots)
+        return scratch
+
+    def add_thread(self, scratch, state, pos, threads, n_threads, slots):
+        # Adds the read states and the accept state reachable from state to
+        # threads, depth first in priority order, with the slots in
+        # scratch.work as changed along the way. Returns the new n_threads.
+        reads = self.reads
+        eps = self.eps
+        saves = self.saves
+        visited = scratch.visited
+        work = scratch.work
+        n_slots = self.n_slots
+        stack = scratch.stack
+        stack.append(state)
+        while stack:
+            state = stack.pop()
+            if state < 0:
+                # undo a slot change once the states after it are added
+                work[~state] = stack.pop()
+                continue
+            if state in visited:
+                continue
+            visited.add(state)
+            if reads[state] is not None or state == self.accept:
+                threads[n_threads] = state
+                n_threads += 1
+                base = state * n_slots
+                for i in range(n_slots):
+                    slots[base + i] = work[i]
+                continue
+            save = saves[state]
+            if save >= 0:
+                stack.append(work[save])
+                stack.append(~save)
+                work[save] = pos
+            dests = eps[state]
+            for i in range(len(dests) - 1, -1, -1):
+                stack.append(dests[i])
+        return n_threads
+
+    def load(self, scratch, slots, state):
+        base = state * self.n_slots
+        work = scratch.work
+        for i in range(self.n_slots):
+            work[i] = slots[base + i]
+
+    def spans(self, slots, state):
+        # (start, end) of every group, or None for those that did not match
+        base = state * self.n_slots
+        return tuple([(slots[base + i], slots[base + i + 1]) if slots[base + i + 1] >= 0 else None
+                      for i in range(0, self.n_slots, 2)])
+
+    def groups(self, s):
+        # spans of the groups if the whole of s matches, else None
+        charset.require_str(s, 'the captures engine')
+        alphabet = self.alphabet
+        reads = self.reads
+        targets = self.targets
+        scratch = self.scratch()
+        current, next_ = scratch.current, scratch.next
+        current_slots, next_slots = scratch.current_slots, scratch.next_slots
+        scratch.visited.clear()
+        for i in range(self.n_slots):
+            scratch.work[i] = -1
+        n_current = self.add_thread(scratch, self.start, 0, current, 0, current_slots)
+        for pos, c in enumerate(s):
+            char_class = alphabet[c]
+            scratch.visited.clear()
+            n_next = 0
+            for i in range(n_current):
+                state = current[i]
+                classes = reads[state]
+                if classes is not None and char_class in classes:
+                    self.load(scratch, current_slots, state)
+                    n_next = self.add_thread(scratch, targets[state], pos + 1, next_, n_next, next_slots)
+            if n_next == 0:
+                return None
+            current, next_ = next_, current
+            current_slots, next_slots = next_slots, current_slots
+            n_current = n_next
+        for i in range(n_current):
+            if current[i] == self.accept:
+                return self.spans(current_slots, self.accept)
+        return None
+
+    def match(self, s):
+        return self.groups(s) is not None
+
+    def fullmatch(self, s):
+        return self.match(s)
+
+    def search_groups(self, s, pos=0):
+        # spans of the groups of the leftmost-longest match in s[pos:]
+        charset.require_str(s, 'the captures engine')
+        alphabet = self.alphabet
+        reads = self.reads
+        targets = self.targets
+        accept = self.accept
+        n_slots = self.n_slots
+        scratch = self.scratch()
+        current, next_ = scratch.current, scratch.next
+        current_slots, next_slots = scratch.current_slots, scratch.next_slots
+        best = None
+        best_start = len(s) + 1
+        scratch.visited.clear()
+        n_current = 0
+        while True:
+            if best is None:
+                # threads started here come last, after those started before
+                for i in range(n_slots):
+                    scratch.work[i] = -1
+                n_current = self.add_thread(scratch, self.start, pos, current, n_current, current_slots)
+            for i in range(n_current):
+                state = current[i]
+                if state == accept:
+                    start = current_slots[state * n_slots]
+                    if start <= best_start:
+                        best = self.spans(current_slots, state)
+                        best_start = start
+                    break
+            if pos == len(s):
+                break
+            char_class = alphabet[s[pos]]
+            scratch.visited.clear()
+            n_next = 0
+            for i in range(n_current):
+                state = current[i]
+                classes = reads[state]
+                if classes is not None and char_class in classes and current_slots[state * n_slots] <= best_start:
+                    self.load(scratch, current_slots, state)
+                    n_next = self.add_thread(scratch, targets[state], pos + 1, next_, n_next, next_slots)
+            if n_next == 0 and best is not None:
+                break
+            current, next_ = next_, current
+            current_slots, next_slots = next_slots, current_slots
+            n_current = n_next
+            pos += 1
+        return best
+
+    def search(self, s):
+        return next(self.finditer(s), None)
+
+    def finditer_groups(self, s):
+        charset.require_str(s, 'the captures engine')
+        pos = 0
+        while pos <= len(s):
+            spans = self.search_groups(s, pos)
+            if spans is None:
+                return
+            yield spans
+            start, end = spans[0]
+            pos = end if end > start else end + 1
+
+    def finditer(self, s):
+        for spans in self.finditer_groups(s):
+            yield spans[0]
+
+    def findall(self, s):
+        return [s[start:end] for start, end in self.finditer(s)]
+
+class Scratch: # the buffers of one thread matching with a CaptureMatcher
+    def __init__(self, n_states, n_slots):
+        self.visited = automata.SparseSet(n_states)
+        self.current = [0] * n_states
+        self.next = [0] * n_states
+        self.current_slots = [-1] * (n_states * n_slots)
+        self.next_slots = [-1] * (n_states * n_slots)
+        self.work = [-1] * n_slots
+        self.stack = []
+
+class CaptureNFABuilder:
+    def __init__(self, ast):
+        self.alphabet, _, self.set_classes = charset.classes(syntax.char_sets(ast))
+        self.n_groups = 0
+        self.reads = []
+        self.targets = []
+        self.eps = []
+        self.saves = []
+
+    def new_state(self, save=-1):
+        self.reads.append(None)
+        self.targets.append(-1)
+        self.eps.append([])
+        self.saves.append(save)
+        return len(self.reads) - 1
+
+    def build(self, ast_node):
+        # returns the (start, end) states of the fragment for ast_node
+        type2method = {
+            syntax.EpsilonNode :        self.build_epsilon,
+            syntax.CharNode :           self.build_char,
+            syntax.ConcatenationNode :  self.build_concatenation,
+            syntax.UnionNode :          self.build_union,
+            syntax.QuantificationNode : self.build_quantification,
+            syntax.GroupNode :          self.build_group,
+            }
+        return type2method[type(ast_node)](ast_node)
+
+    def build_epsilon(self, ast_node):
+        state = self.new_state()
+        return state, state
+
+    def build_char(self, ast_node):
+        start = self.new_state()
+        end = self.new_state()
+        self.reads[start] = frozenset(self.set_classes[ast_node.intervals])
+        self.targets[start] = end
+        return start, end
+
+    def build_concatenation(self, ast_node):
+        start, end = self.build_epsilon(None)
+        for child in ast_node.children:
+            child_start, child_end = self.build(child)
+            self.eps[end].append(child_start)
+            end = child_end
+        return start, end
+
+    def build_union(self, ast_node):
+        start = self.new_state()
+        end = self.new_state()
+        for child in ast_node.children:
+            child_start, child_end = self.build(child)
+            self.eps[start].append(child_start)
+            self.eps[child_end].append(end)
+        return start, end
+
+    def build_quantification(self, ast_node):
+        # unrolled like automata.CompactNFABuilder, greedily: every split
+        # prefers one more copy of the operand, and x{0,2} is (x(x)?)?
+        start, end = self.build_epsilon(None)
+        for _ in range(ast_node.lb):
+            child_start, child_end = self.build(ast_node.operand)
+            self.eps[end].append(child_start)
+            end = child_end
+        exit_ = self.new_state()
+        if ast_node.ub < float('inf'):
+            for _ in range(ast_node.lb, ast_node.ub):
+                split = self.new_state()
+                child_start, child_end = self.build(ast_node.operand)
+                self.eps[end].append(split)
+                self.eps[split] += [child_start, exit_]
+                end = child_end
+            self.eps[end].append(exit_)
+        else:
+            loop = self.new_state()
+            child_start, child_end = self.build(ast_node.operand)
+            self.eps[end].append(loop)
+            self.eps[loop] += [child_start, exit_]
+            self.eps[child_end].append(loop)
+        return start, exit_
+
+    def build_group(self, ast_node):
+        self.n_groups = max(self.n_groups, ast_node.index)
+        start = self.new_state(save=2 * ast_node.index)
+        end = self.new_state(save=2 * ast_node.index + 1)
+        child_start, child_end = self.build(ast_node.operand)
+        self.eps[start].append(child_start)
+        self.eps[child_end].append(end)
+        return start, end
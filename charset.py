@@ -0,0 +1,185 @@
+# Character classes as sorted tuples of disjoint (first, last) code point
+# intervals, so that a class takes memory and time in proportion to its
+# number of ranges rather than of chars: '.' is ((0, MAX_CODE_POINT),).
+#
+# Engines split code points into the segments on which all the classes
+# of a pattern agree, and number the distinct combinations (classes()),
+# class 0 being the chars no class contains. A CharMap then maps chars to
+# those numbers by binary search over the segment starts, caching the
+# answers below CACHE_LIMIT, so that the cache stays small however many
+# distinct chars the input has.
+#
+# utf8_sequences() turns intervals into sequences of byte ranges matching
+# exactly the UTF-8 encodings of their code points, which is how automata
+# over UTF-8 bytes read a class. Only the dfa and table engines have such
+# automata; the others take str input only, see require_str().
+
+from bisect import bisect_right
+from collections import namedtuple
+
+MAX_CODE_POINT = 0x10FFFF
+# ASCII, Latin, Greek, Cyrillic, Hebrew and Arabic, i.e. up to 2 bytes
+# in UTF-8
+CACHE_LIMIT = 0x800
+ANY = ((0, MAX_CODE_POINT),)
+
+# UTF-8 cannot encode these
+SURROGATES = (0xD800, 0xDFFF)
+
+def normalize(intervals):
+    # sorted, with overlapping and adjacent intervals merged
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return tuple(merged)
+
+def from_chars(chars):
+    return normalize([(ord(char), ord(char)) for char in chars])
+
+def negate(intervals):
+    complement = []
+    first = 0
+    for lo, hi in intervals:
+        if first < lo:
+            complement.append((first, lo - 1))
+        first = hi + 1
+    if first <= MAX_CODE_POINT:
+        complement.append((first, MAX_CODE_POINT))
+    return tuple(complement)
+
+def size(intervals):
+    return sum([last - first + 1 for first, last in intervals])
+
+def chars(intervals):
+    # only sensible for small classes
+    return {chr(code) for first, last in intervals for code in range(first, last + 1)}
+
+def to_str(intervals):
+    return ''.join([chr(first) if first == last else '%s-%s' % (chr(first), chr(last))
+                    for first, last in intervals])
+
+def partition(interval_sets):
+    # Splits code points into segments inside or outside each of
+    # interval_sets alike. Returns the segment starts, from 0, and for every
+    # segment the sorted tuple of the indices of the sets containing it.
+    events = {0: []}
+    for i, intervals in enumerate(interval_sets):
+        for first, last in intervals:
+            events.setdefault(first, []).append((i, 1))
+            if last < MAX_CODE_POINT:
+                events.setdefault(last + 1, []).append((i, -1))
+    starts = sorted(events)
+    counts = [0] * len(interval_sets)
+    signatures = []
+    for start in starts:
+        for i, delta in events[start]:
+            counts[i] += delta
+        signatures.append(tuple([i for i, count in enumerate(counts) if count]))
+    return starts, signatures
+
+Classes = namedtuple('Classes', ['alphabet', 'n_classes', 'set_classes'])
+
+def classes(interval_sets):
+    # Numbers the chars by the interval_sets they belong to. alphabet maps
+    # chars to class numbers, from 1 up to n_classes - 1 or 0 for chars in
+    # no set, and set_classes maps each of interval_sets to the sorted
+    # tuple of its classes.
+    interval_sets = list(dict.fromkeys(interval_sets))
+    starts, signatures = partition(interval_sets)
+    numbers = {(): 0}
+    for signature in signatures:
+        if signature not in numbers:
+            numbers[signature] = len(numbers)
+    members = [set() for _ in interval_sets]
+    for signature in signatures:
+        for i in signature:
+            members[i].add(numbers[signature])
+    set_classes = {intervals: tuple(sorted(members[i])) for i, intervals in enumerate(interval_sets)}
+    return Classes(CharMap(starts, [numbers[signature] for signature in signatures]), len(numbers), set_classes)
+
+def require_str(s, reader):
+    # Bytes are UTF-8 to the engines that read them, and reading them as
+    # code points would silently mean Latin-1 instead.
+    if not isinstance(s, str):
+        raise TypeError('%s only reads str, decode bytes first or use the dfa engine' % reader)
+    return s
+
+class CharMap(dict): # chars or code points to the value of their segment
+    def __init__(self, starts, values):
+        # values[i] holds from starts[i] up to starts[i+1] - 1; adjacent
+        # segments with equal values are merged
+        super().__init__()
+        self.starts = []
+        self.values = []
+        for start, value in zip(starts, values):
+            if not self.values or value != self.values[-1]:
+                self.starts.append(start)
+                self.values.append(value)
+
+    def __missing__(self, key):
+        # keys are chars, or code points as str.translate() passes them
+        code = key if isinstance(key, int) else ord(key)
+        value = self.values[bisect_right(self.starts, code) - 1]
+        if code < CACHE_LIMIT:
+            self[key] = value
+        return value
+
+    def __reduce__(self):
+        return CharMap, (self.starts, self.values)
+
+    def segments(self):
+        # (first, last, value) of every segment, in order
+        ends = self.starts[1:] + [MAX_CODE_POINT + 1]
+        return [(start, end - 1, value) for start, end, value in zip(self.starts, ends, self.values)]
+
+    def remap(self, mapping):
+        return CharMap(self.starts, [mapping[value] for value in self.values])
+
+UTF8_MAX = [0x7F, 0x7FF, 0xFFFF]
+
+def utf8_sequences(intervals):
+    # Sequences of (first, last) byte ranges, one byte range per byte of
+    # the encoding, which together match the UTF-8 encodings of exactly
+    # the code points of intervals. Each interval is split until all its
+    # code points encode to the same length and, below the leading byte,
+    # every byte spans whole continuation ranges, as in RE2 and Rust's
+    # regex.
+    sequences = []
+    stack = []
+    for first, last in reversed(intervals):
+        if first <= SURROGATES[1] and last >= SURROGATES[0]:
+            if last > SURROGATES[1]:
+                stack.append((SURROGATES[1] + 1, last))
+            if first < SURROGATES[0]:
+                stack.append((first, SURROGATES[0] - 1))
+        else:
+            stack.append((first, last))
+    while stack:
+        first, last = stack.pop()
+        split = split_utf8(first, last)
+        if split is not None:
+            stack.append(split[1])
+            stack.append(split[0])
+            continue
+        sequences.append(tuple(zip(chr(first).encode('utf-8'), chr(last).encode('utf-8'))))
+    return sequences
+
+def split_utf8(first, last):
+    # two intervals to handle separately, or None if there is no need
+    for max_code in UTF8_MAX:
+        if first <= max_code < last:
+            return (first, max_code), (max_code + 1, last)
+    if last <= UTF8_MAX[0]:
+        return None
+    for i in range(1, 4):
+        mask = (1 << (6 * i)) - 1
+        if first & ~mask != last & ~mask:
+            if first & mask:
+                return (first, first | mask), ((first | mask) + 1, last)
+            if last & mask != mask:
+                return (first, (last & ~mask) - 1), (last & ~mask, last)
+    return None
@@ -59,8 +59,10 @@ def lexical_analysis(s):
             tokens.append(UnionToken(s[pos]))
             pos += 1
         elif s[pos] == '(':
-            tokens.append(OpenParToken(s[pos]))
-            pos += 1
+            # groups never capture here, so (?:...) is the same as (...)
+            end_pos = pos + 3 if s.startswith('?:', pos + 1) else pos + 1
+            tokens.append(OpenParToken(s[pos:end_pos]))
+            pos = end_pos
         elif s[pos] == ')':
             tokens.append(CloseParToken(s[pos]))
             pos += 1
@@ -0,0 +1,173 @@
+# Literal strings that matches of a pattern must contain, used to skip
+# input with str.find()/bytes.find() before running an automaton.
+#
+# For every AST node we compute
+#   exact     the set of strings the node matches, if small enough,
+#   prefixes  strings one of which every match starts with,
+#   suffixes  strings one of which every match ends with,
+#   required  a string every match contains,
+# where None stands for "too many to enumerate" and {''} or '' for "no
+# information". Sets are capped at MAX_LITERALS strings and char classes
+# are only expanded up to MAX_CLASS_SIZE chars, so the analysis stays
+# linear in the size of the AST.
+
+import charset
+import syntax
+
+MAX_LITERALS = 16
+MAX_CLASS_SIZE = 4
+MAX_LENGTH = 64
+
+class Literals:
+    def __init__(self, exact=None, prefixes=None, suffixes=None, required=''):
+        if exact is not None:
+            prefixes = exact
+            suffixes = exact
+            if len(exact) == 1:
+                required = next(iter(exact))
+        self.exact = exact
+        self.prefixes = prefixes if prefixes is not None else {''}
+        self.suffixes = suffixes if suffixes is not None else {''}
+        self.required = required
+
+    def __str__(self):
+        return 'Literals(exact=%s, prefixes=%s, suffixes=%s, required=%r)' % \
+            (self.exact, self.prefixes, self.suffixes, self.required)
+
+def cross(left, right):
+    if left is None or right is None or len(left) * len(right) > MAX_LITERALS:
+        return None
+    product = {l + r for l in left for r in right}
+    if max([len(s) for s in product]) > MAX_LENGTH:
+        return None
+    return product
+
+def union(sets):
+    if any([s is None for s in sets]):
+        return None
+    merged = set().union(*sets)
+    if len(merged) > MAX_LITERALS:
+        return None
+    return merged
+
+def informative(literals):
+    # a prefix or suffix set says nothing as soon as it contains ''
+    return literals is not None and '' not in literals
+
+def analyze(ast_node):
+    type2method = {
+        syntax.EpsilonNode :        analyze_epsilon,
+        syntax.CharNode :           analyze_char,
+        syntax.ConcatenationNode :  analyze_concatenation,
+        syntax.UnionNode :          analyze_union,
+        syntax.QuantificationNode : analyze_quantification,
+        }
+    return type2method[type(ast_node)](ast_node)
+
+def analyze_epsilon(ast_node):
+    return Literals(exact={''})
+
+def analyze_char(ast_node):
+    if charset.size(ast_node.intervals) <= MAX_CLASS_SIZE:
+        return Literals(exact=charset.chars(ast_node.intervals))
+    return Literals()
+
+def concatenate(left, right):
+    exact = cross(left.exact, right.exact)
+    if exact is not None:
+        return Literals(exact=exact)
+    # left.exact followed by right.prefixes are still prefixes, and if
+    # that gets too large left.prefixes alone are
+    prefixes = left.prefixes
+    if left.exact is not None:
+        prefixes = cross(left.exact, right.prefixes) or left.exact
+    suffixes = right.suffixes
+    if right.exact is not None:
+        suffixes = cross(left.suffixes, right.exact) or right.exact
+    # a lone prefix or suffix spanning both sides is required as well
+    candidates = [left.required, right.required]
+    candidates += [next(iter(s)) for s in [prefixes, suffixes] if len(s) == 1]
+    required = max(candidates, key=len)
+    return Literals(prefixes=prefixes, suffixes=suffixes, required=required)
+
+def analyze_concatenation(ast_node):
+    literals = analyze_epsilon(None)
+    for child in ast_node.children:
+        literals = concatenate(literals, analyze(child))
+    return literals
+
+def analyze_union(ast_node):
+    children = [analyze(child) for child in ast_node.children]
+    exact = union([child.exact for child in children])
+    if exact is not None:
+        return Literals(exact=exact)
+    required = children[0].required
+    if any([child.required != required for child in children]):
+        required = ''
+    return Literals(prefixes=union([child.prefixes for child in children]),
+                    suffixes=union([child.suffixes for child in children]),
+                    required=required)
+
+def analyze_quantification(ast_node):
+    operand = analyze(ast_node.operand)
+    if ast_node.ub < float('inf') and operand.exact is not None:
+        exact = {''}
+        repeated = set()
+        for count in range(ast_node.ub + 1):
+            if count >= ast_node.lb:
+                repeated = union([repeated, exact])
+            if count < ast_node.ub:
+                exact = cross(exact, operand.exact)
+            if exact is None or repeated is None:
+                break
+        else:
+            return Literals(exact=repeated)
+    if ast_node.lb == 0:
+        return Literals()
+    # at least one copy of the operand, possibly more
+    literals = operand
+    for _ in range(1, ast_node.lb):
+        literals = concatenate(literals, operand)
+    return Literals(prefixes=literals.prefixes, suffixes=literals.suffixes, required=literals.required)
+
+class Prefilter:
+    def __init__(self, required='', prefixes=None):
+        # required: every match contains it; prefixes: every match starts
+        # with one of them, or None
+        self.required = required
+        self.prefixes = prefixes
+        self.required_bytes = encode(required)
+        self.prefixes_bytes = None
+        if prefixes is not None:
+            self.prefixes_bytes = [encode(prefix) for prefix in prefixes]
+            if None in self.prefixes_bytes:
+                self.prefixes_bytes = None
+
+    def __str__(self):
+        return 'Prefilter(required=%r, prefixes=%s)' % (self.required, self.prefixes)
+
+    @classmethod
+    def from_ast(cls, ast):
+        literals = analyze(ast)
+        prefixes = sorted(literals.prefixes) if informative(literals.prefixes) else None
+        required = literals.required
+        # a single prefix is also a required literal, and a longer one
+        # skips more input
+        if prefixes is not None and len(prefixes) == 1 and len(prefixes[0]) >= len(required):
+            required = prefixes[0]
+        if not required and prefixes is None:
+            return None
+        return Prefilter(required, prefixes)
+
+    def literals_for(self, s):
+        # (required, prefixes) in the type of s
+        if isinstance(s, str):
+            return self.required, self.prefixes
+        return self.required_bytes or b'', self.prefixes_bytes
+
+def encode(literal):
+    # bytes input is UTF-8, see table.TableDFA.utf8
+    try:
+        return literal.encode('utf-8')
+    except UnicodeEncodeError:
+        return None
@@ -26,6 +26,18 @@ def profile(pattern, string):
     after = time.time()
     elapsed = after - before
     print(f'my regex took {elapsed} sec')
+    table_matcher = regex.compile_regex(pattern, engine='table')
+    before = time.time()
+    for _ in range(REPEAT):
+        table_matcher.match(string)
+    after = time.time()
+    elapsed = after - before
+    print(f'my regex (table) took {elapsed} sec')
+    before = time.time()
+    table_matcher.match_many([string] * REPEAT)
+    after = time.time()
+    elapsed = after - before
+    print(f'my regex (table, match_many) took {elapsed} sec')
 
 if __name__ == '__main__':
     profile('a+' * 20, 'a'*20)
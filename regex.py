@@ -1,19 +1,645 @@
 import automata
-import lex
+import bitparallel
+import captures
+import literals
 import syntax
+import table
 
-def compile_regex(regex):
-        tokens = lex.lexical_analysis(regex)
-        ast = syntax.syntactic_analysis(tokens)
-        nfa = automata.NFA.from_ast(ast)
-        nfa.epsilon_elimination()
-        dfa = automata.DFA.from_nfa(nfa)
-        return dfa
+import argparse
+import concurrent.futures
+import io
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque, namedtuple
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+class PatternCache: # LRU cache of compiled patterns, shared by all threads
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, matcher):
+        with self.lock:
+            self.entries[key] = matcher
+            self.entries.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxsize):
+        with self.lock:
+            self.maxsize = maxsize
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def info(self):
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self.entries))
+
+pattern_cache = PatternCache()
+
+def cache_info():
+    return pattern_cache.info()
+
+def clear_cache():
+    pattern_cache.clear()
+
+def set_cache_size(maxsize):
+    pattern_cache.resize(maxsize)
+
+# engine='auto' builds a DFA when it has at most AUTO_DFA_STATES states
+# and takes at most AUTO_DFA_WORK steps to build, and simulates the NFA
+# otherwise. Subset construction is abandoned as soon as either is hit.
+AUTO_DFA_STATES = 10000
+AUTO_DFA_WORK = 100000
+
+# Counted repetitions are unrolled into copies of their operand by every
+# engine except bitparallel, which keeps a counter for repetitions of a
+# single char class. Bounds above max_repeat are rejected, and with
+# engine='auto' patterns with bounds above AUTO_COUNTER_REPEAT go to the
+# bit-parallel engine directly when it can take them.
+MAX_REPEAT = 1000
+AUTO_COUNTER_REPEAT = 100
+
+# Compile limits, each None for no limit. Memory is estimated as
+# NFA_STATE_BYTES per NFA state, and per DFA state DFA_STATE_BYTES plus
+# DFA_TRANSITION_BYTES per char class.
+Limits = namedtuple('Limits', ['max_repeat', 'max_nfa_states', 'max_dfa_states', 'max_compile_time', 'max_memory'])
+DEFAULT_LIMITS = Limits(MAX_REPEAT, None, None, None, None)
+
+NFA_STATE_BYTES = 64
+DFA_STATE_BYTES = 200
+DFA_TRANSITION_BYTES = 50
+
+# raised by table.TableDFA as well, when a search DFA outgrows the limits
+CompileLimitError = table.CompileLimitError
+
+class RepetitionTooLarge(CompileLimitError):
+    pass
+
+Cost = namedtuple('Cost', ['nfa_states', 'positions', 'repetition_bound', 'memory'])
+
+def estimate_cost(regex):
+    # What compiling regex would take, from its AST alone: states of the
+    # unrolled NFA, char positions for the bit-parallel engine (counted
+    # repetitions of a char class being one), the largest repetition
+    # bound, and the estimated memory of the NFA. A DFA may still need
+    # up to 2 ** positions states.
+    ast = syntax.parse(regex)
+    nfa_states = count_nfa_states(ast)
+    return Cost(nfa_states, count_positions(ast), repetition_bound(ast), nfa_states * NFA_STATE_BYTES)
+
+def count_nfa_states(ast_node):
+    # as built by automata.CompactNFABuilder
+    if type(ast_node) == syntax.EpsilonNode:
+        return 1
+    elif type(ast_node) == syntax.CharNode:
+        return 2
+    elif type(ast_node) == syntax.ConcatenationNode:
+        return 1 + sum([count_nfa_states(child) for child in ast_node.children])
+    elif type(ast_node) == syntax.UnionNode:
+        return 2 + sum([count_nfa_states(child) for child in ast_node.children])
+    operand = count_nfa_states(ast_node.operand)
+    if ast_node.ub == float('inf'):
+        return 2 + (ast_node.lb + 1) * operand
+    return 1 + ast_node.ub * operand
+
+def count_positions(ast_node):
+    # as built by bitparallel.Glushkov
+    if type(ast_node) == syntax.EpsilonNode:
+        return 0
+    elif type(ast_node) == syntax.CharNode:
+        return 1
+    elif type(ast_node) == syntax.ConcatenationNode or type(ast_node) == syntax.UnionNode:
+        return sum([count_positions(child) for child in ast_node.children])
+    elif bitparallel.is_counted(ast_node):
+        return 1
+    operand = count_positions(ast_node.operand)
+    if ast_node.ub == float('inf'):
+        return max(ast_node.lb, 1) * operand
+    return ast_node.ub * operand
+
+def repetition_bound(ast_node):
+    # largest finite bound of any counted repetition in ast_node
+    if type(ast_node) == syntax.QuantificationNode:
+        bound = ast_node.lb if ast_node.ub == float('inf') else ast_node.ub
+        return max(bound, repetition_bound(ast_node.operand))
+    elif type(ast_node) == syntax.ConcatenationNode or type(ast_node) == syntax.UnionNode:
+        return max([repetition_bound(child) for child in ast_node.children], default=0)
+    return 0
+
+def is_non_ascii(ast):
+    return any([last > 0x7F for intervals in syntax.char_sets(ast) for _, last in intervals])
+
+def compile_regex(regex, engine='dfa', max_states=1000, minimize=False, cache=True, max_repeat=MAX_REPEAT,
+                  max_nfa_states=None, max_dfa_states=None, max_compile_time=None, max_memory=None, stats=False):
+        # Only the dfa and table engines search, stream and save; auto may
+        # pick one of the others, which only match whole strings, so it is
+        # opt-in. max_states bounds the cache of the lazy engine. The other max_*
+        # arguments are Limits, which raise CompileLimitError when hit,
+        # except that engine='auto' uses an NFA engine rather than build a
+        # DFA beyond max_dfa_states or max_memory. stats adds compile
+        # phase timings and sizes to matcher.stats, and match counters as
+        # matcher.match_counters, see MatchCounters.
+        limits = Limits(max_repeat, max_nfa_states, max_dfa_states, max_compile_time, max_memory)
+        if not cache:
+            return build_matcher(regex, engine, max_states, minimize, limits, stats)
+        key = (regex, engine, max_states, minimize, limits, stats)
+        matcher = pattern_cache.get(key)
+        if matcher is None:
+            # compiled outside the lock, so two threads may both build a
+            # new pattern but neither blocks lookups of other patterns
+            matcher = build_matcher(regex, engine, max_states, minimize, limits, stats)
+            pattern_cache.put(key, matcher)
+        return matcher
+
+def check_limit(limit, value, maximum, regex):
+    if maximum is not None and value > maximum:
+        raise CompileLimitError(limit, value, maximum, regex)
+
+def build_matcher(regex, engine, max_states, minimize, limits=DEFAULT_LIMITS, collect_stats=False):
+        if collect_stats:
+            # The peak of traced memory over an inner call collecting the
+            # other stats. Tracing slows all the phases down alike.
+            tracing = tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+            base_memory = tracemalloc.get_traced_memory()[0]
+            try:
+                matcher = build_matcher(regex, engine, max_states, minimize, limits, None)
+            finally:
+                peak_memory = tracemalloc.get_traced_memory()[1] - base_memory
+                if not tracing:
+                    tracemalloc.stop()
+            matcher.stats['peak_memory'] = peak_memory
+            instrument(matcher)
+            return matcher
+        start_time = time.perf_counter()
+        deadline = None
+        if limits.max_compile_time is not None:
+            deadline = start_time + limits.max_compile_time
+
+        def check_time():
+            if deadline is not None and time.perf_counter() > deadline:
+                elapsed = time.perf_counter() - start_time
+                raise CompileLimitError('max_compile_time', elapsed, limits.max_compile_time, regex)
+
+        # collect_stats is None on the inner call made with stats on; phase
+        # 'stats' is the time spent counting transitions for them
+        phases = {}
+        phase_start = [start_time]
+
+        def end_phase(name):
+            if collect_stats is None:
+                now = time.perf_counter()
+                phases[name] = phases.get(name, 0.0) + now - phase_start[0]
+                phase_start[0] = now
+
+        ast = syntax.parse(regex)
+        end_phase('parse')
+        bound = repetition_bound(ast)
+        if limits.max_repeat is not None and bound > limits.max_repeat:
+            raise RepetitionTooLarge('max_repeat', bound, limits.max_repeat, regex)
+        stats = {}
+        matcher = None
+        auto = engine == 'auto'
+        if auto and bound > AUTO_COUNTER_REPEAT:
+            try:
+                matcher = bitparallel.BitParallelMatcher.from_ast(ast)
+                engine = 'bitparallel'
+            except bitparallel.TooManyPositions:
+                pass
+            end_phase('bitparallel')
+        if engine in ('auto', 'dfa', 'table', 'lazy', 'nfa', 'captures'):
+            # every engine but bitparallel unrolls the NFA
+            nfa_states = count_nfa_states(ast)
+            check_limit('max_nfa_states', nfa_states, limits.max_nfa_states, regex)
+            check_limit('max_memory', nfa_states * NFA_STATE_BYTES, limits.max_memory, regex)
+        if engine in ('auto', 'dfa', 'table'):
+            # DFAs are built from the array based NFA
+            compact_nfa = automata.CompactNFA.from_ast(ast)
+            stats['nfa_states'] = compact_nfa.n_states
+            end_phase('nfa')
+            if collect_stats is None:
+                stats['nfa_transitions'] = len(compact_nfa.read_classes)
+                stats['nfa_epsilon_transitions'] = len(compact_nfa.eps_targets)
+                end_phase('stats')
+            check_time()
+            # the smallest of the limits on DFA states applies
+            state_bytes = DFA_STATE_BYTES + DFA_TRANSITION_BYTES * compact_nfa.n_classes
+            dfa_limits = []
+            if limits.max_dfa_states is not None:
+                dfa_limits.append((limits.max_dfa_states, 'max_dfa_states', 1))
+            if limits.max_memory is not None:
+                dfa_limits.append((limits.max_memory // state_bytes, 'max_memory', state_bytes))
+            if auto:
+                dfa_limits.append((AUTO_DFA_STATES, None, 1))
+            max_dfa_states, limit, unit = min(dfa_limits, key=lambda dfa_limit: dfa_limit[0], default=(None, None, 1))
+            utf8_dfa = None
+            try:
+                dfa = compact_nfa.to_dfa(max_states=max_dfa_states, max_work=AUTO_DFA_WORK if auto else None,
+                                         deadline=deadline)
+                end_phase('dfa')
+                if is_non_ascii(ast):
+                    # bytes input is read as UTF-8 by a second DFA over
+                    # bytes, see table.TableDFA.utf8
+                    utf8_nfa = automata.CompactNFA.from_ast(ast, utf8=True)
+                    utf8_dfa = utf8_nfa.to_dfa(max_states=max_dfa_states, max_work=AUTO_DFA_WORK if auto else None,
+                                               deadline=deadline)
+                    end_phase('utf8_dfa')
+                if auto:
+                    engine = 'dfa'
+            except automata.CompileTimeout:
+                check_time()
+                raise
+            except automata.TooManyStates:
+                if not auto:
+                    raise CompileLimitError(limit, (max_dfa_states + 1) * unit, getattr(limits, limit), regex)
+                end_phase('dfa')
+                try:
+                    matcher = bitparallel.BitParallelMatcher.from_ast(ast)
+                    engine = 'bitparallel'
+                except bitparallel.TooManyPositions:
+                    engine = 'nfa'
+                end_phase('bitparallel')
+            # The reverse and unanchored DFAs searching needs are built on
+            # first use, within the limits given here, see
+            # table.SearchLimits.
+            search_limits = None
+            max_search_states, search_limit, search_unit = min(
+                [dfa_limit for dfa_limit in dfa_limits if dfa_limit[1] is not None],
+                key=lambda dfa_limit: dfa_limit[0], default=(None, None, 1))
+            if max_search_states is not None or limits.max_compile_time is not None:
+                search_limits = table.SearchLimits(max_search_states, search_limit, search_unit,
+                                                   getattr(limits, search_limit) if search_limit else None,
+                                                   limits.max_compile_time, regex)
+        if auto:
+            stats['engine'] = engine
+        if engine == 'lazy' or engine == 'nfa':
+            nfa = automata.NFA.from_ast(ast)
+            end_phase('nfa')
+            nfa.epsilon_elimination()
+            stats['nfa_states'] = len(nfa.enum_states())
+            end_phase('epsilon_elimination')
+            if collect_stats is None:
+                stats['nfa_transitions'] = sum([len(dests) for state in nfa.enum_states()
+                                                for dests in state.transitions.values()])
+                end_phase('stats')
+            check_time()
+        if matcher is not None:
+            pass
+        elif engine == 'lazy':
+            # max_states bounds the number of DFA states kept in memory
+            matcher = automata.LazyDFA.from_nfa(nfa, max_states=max_states)
+        elif engine == 'nfa':
+            matcher = automata.PikeVM.from_nfa(nfa)
+        elif engine == 'bitparallel':
+            matcher = bitparallel.BitParallelMatcher.from_ast(ast)
+        elif engine == 'captures':
+            # the only engine that sees groups, see captures.py
+            matcher = captures.CaptureMatcher.from_ast(syntax.parse(regex, captures=True))
+            stats['nfa_states'] = matcher.n_states
+        elif engine == 'dfa' or engine == 'table':
+            stats['dfa_states'] = len(dfa.enum_states())
+            if minimize:
+                dfa = dfa.minimize()
+                stats['minimized_dfa_states'] = len(dfa.enum_states())
+                end_phase('minimize')
+            if collect_stats is None:
+                stats['dfa_transitions'] = sum([len(state.transitions) for state in dfa.enum_states()])
+                end_phase('stats')
+            utf8 = None
+            if utf8_dfa is not None:
+                stats['utf8_dfa_states'] = len(utf8_dfa.enum_states())
+                if minimize:
+                    utf8_dfa = utf8_dfa.minimize()
+                    end_phase('minimize')
+                utf8 = table.TableDFA.from_dfa(utf8_dfa)
+                utf8.search_limits = search_limits
+            if engine == 'table':
+                matcher = table.TableDFA.from_dfa(dfa)
+            else:
+                matcher = dfa
+            end_phase('table')
+            matcher.utf8 = utf8
+            matcher.search_limits = search_limits
+            matcher.prefilter = literals.Prefilter.from_ast(ast)
+            if utf8 is not None:
+                utf8.prefilter = matcher.prefilter
+        else:
+            raise Exception('unknown engine: %s' % engine)
+        end_phase('matcher')
+        check_time()
+        if collect_stats is None:
+            stats['phases'] = phases
+            stats['compile_seconds'] = time.perf_counter() - start_time
+        matcher.stats = stats
+        matcher.match_counters = None
+        return matcher
+
+class MatchCounters: # what a matcher compiled with stats=True was asked
+    # calls per matching method, the len() of all inputs (chars for str,
+    # bytes for bytes), inputs or lines rejected by the literal prefilter
+    # without running any automaton, and for the lazy engine the chars
+    # whose transition was cached or had to be built. Calls a matching
+    # method makes to another one (findall() to finditer()) are not
+    # counted again. Counters are not locked, so threads sharing a
+    # matcher may lose counts.
+    def __init__(self):
+        self.busy = False
+        self.calls = {}
+        self.scanned = 0
+        self.rejections = 0
+        self.lazy = None
+
+    def as_dict(self):
+        counters = {'calls': dict(self.calls), 'scanned': self.scanned, 'rejections': self.rejections}
+        if self.lazy is not None:
+            counters['lazy_cache_misses'] = self.lazy.cache_misses
+            counters['lazy_cache_hits'] = self.lazy.scanned - self.lazy.cache_misses
+            counters['lazy_flushes'] = self.lazy.flushes
+        return counters
+
+MATCH_METHODS = ['match', 'fullmatch', 'match_many', 'search', 'finditer', 'findall', 'scan_lines',
+                 'groups', 'search_groups', 'finditer_groups']
+
+def instrument(matcher):
+    # Wraps the matching methods of matcher, on the instance only, so
+    # that matchers compiled without stats run exactly the same code as
+    # before. Prefilter rejections are counted by the tables themselves,
+    # and only on their rejection paths.
+    counters = MatchCounters()
+    for name in MATCH_METHODS:
+        if hasattr(matcher, name):
+            setattr(matcher, name, counted(getattr(matcher, name), name, counters))
+    if getattr(matcher, 'utf8', None) is not None:
+        matcher.utf8.match_counters = counters
+    if isinstance(matcher, automata.LazyDFA):
+        counters.lazy = matcher
+    matcher.match_counters = counters
+
+def counted(method, name, counters):
+    many = name == 'match_many'
+
+    def wrapper(s, *args, **kwargs):
+        if counters.busy:
+            return method(s, *args, **kwargs)
+        counters.calls[name] = counters.calls.get(name, 0) + 1
+        if many:
+            # a list, or a numpy array counted by its size in bytes
+            if hasattr(s, 'dtype'):
+                counters.scanned += s.size * s.itemsize
+            else:
+                s = list(s)
+                counters.scanned += sum([len(string) for string in s])
+        else:
+            counters.scanned += len(s)
+        counters.busy = True
+        try:
+            return method(s, *args, **kwargs)
+        finally:
+            counters.busy = False
+    return wrapper
+
+# grep-like command line interface. Input is read as binary in large
+# blocks of whole lines (through mmap for regular files), each block is
+# scanned by the table DFA in one go, and output is written per block.
+#
+# With -j N, blocks are scanned by N worker processes instead. Each worker
+# gets the table once, in its serialized form, when it starts; regular
+# files are split into line-aligned ranges that workers map themselves,
+# while stdin blocks are sent over. Line numbers for -n are counted up
+# front so that workers can format their output, and results are written
+# in input order.
+
+BLOCK_SIZE = 1 << 22
+
+GrepOptions = namedtuple('GrepOptions', ['search', 'invert', 'count', 'line_number'])
+
+def split_lines(buf, block_size=BLOCK_SIZE):
+    pos = 0
+    while pos < len(buf):
+        end = len(buf)
+        if pos + block_size < end:
+            end = buf.find(b'\n', pos + block_size) + 1 or end
+        yield pos, end
+        pos = end
+
+def map_file(f):
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        # pipes, terminals and empty files
+        return None
+
+def iter_blocks(f, block_size=BLOCK_SIZE):
+    buf = map_file(f)
+    if buf is not None:
+        with buf:
+            for start, end in split_lines(buf, block_size):
+                yield buf[start:end]
+        return
+    pending = []
+    while True:
+        chunk = f.read(block_size)
+        if not chunk:
+            break
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            pending.append(chunk)
+            continue
+        pending.append(chunk[:end])
+        yield b''.join(pending)
+        pending = [chunk[end:]]
+    rest = b''.join(pending)
+    if rest:
+        yield rest
+
+def count_lines(block):
+    return block.count(b'\n') + (1 if block and not block.endswith(b'\n') else 0)
+
+def grep_block(matcher, block, options, prefix=b'', first_line=1):
+    # returns the number of selected lines, the number of lines in block
+    # and the output for block
+    selected, n_lines = matcher.scan_lines(block, search=options.search, invert=options.invert)
+    if options.count or not selected:
+        return len(selected), n_lines, b''
+    pieces = []
+    for index, start, end in selected:
+        pieces.append(prefix)
+        if options.line_number:
+            pieces.append(b'%d:' % (first_line + index))
+        pieces.append(block[start:end])
+        pieces.append(b'\n')
+    return len(selected), n_lines, b''.join(pieces)
+
+def grep_file(matcher, f, out, search=True, invert=False, count=False, line_number=False, label=None):
+    options = GrepOptions(search, invert, count, line_number)
+    prefix = b'' if label is None else label.encode() + b':'
+    n_selected = 0
+    first_line = 1
+    for block in iter_blocks(f):
+        n_block_selected, n_lines, output = grep_block(matcher, block, options, prefix, first_line)
+        out.write(output)
+        n_selected += n_block_selected
+        first_line += n_lines
+    if count:
+        out.write(prefix + b'%d\n' % n_selected)
+    return n_selected
+
+worker_matcher = None
+
+def init_worker(data, prefilter):
+    global worker_matcher
+    worker_matcher = table.TableDFA.from_bytes(data)
+    worker_matcher.prefilter = prefilter
+
+def grep_range(path, start, end, options, prefix, first_line):
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return grep_block(worker_matcher, buf[start:end], options, prefix, first_line)
+
+def grep_data(block, options, prefix, first_line):
+    return grep_block(worker_matcher, block, options, prefix, first_line)
+
+def grep_file_parallel(executor, jobs, path, f, out, options, label=None):
+    # path is None for stdin, whose blocks are always sent to the workers.
+    # At most 2 * jobs blocks are in flight, so memory stays bounded
+    # however large the input: the oldest result is written out before
+    # another block is submitted.
+    prefix = b'' if label is None else label.encode() + b':'
+    buf = map_file(f) if path is not None else None
+    futures = deque()
+    n_selected = 0
+
+    def write_oldest():
+        n_block_selected, _, output = futures.popleft().result()
+        out.write(output)
+        return n_block_selected
+
+    def submit(*args):
+        nonlocal n_selected
+        if len(futures) >= 2 * jobs:
+            n_selected += write_oldest()
+        futures.append(executor.submit(*args))
+
+    first_line = 1
+    if buf is not None:
+        with buf:
+            # a few blocks per worker so that uneven blocks even out
+            block_size = max(1 << 16, min(BLOCK_SIZE, len(buf) // (4 * jobs)))
+            for start, end in split_lines(buf, block_size):
+                submit(grep_range, path, start, end, options, prefix, first_line)
+                if options.line_number:
+                    first_line += count_lines(buf[start:end])
+    else:
+        for block in iter_blocks(f):
+            submit(grep_data, block, options, prefix, first_line)
+            if options.line_number:
+                first_line += count_lines(block)
+    while futures:
+        n_selected += write_oldest()
+    if options.count:
+        out.write(prefix + b'%d\n' % n_selected)
+    return n_selected
+
+def main(argv=None, out=None):
+    parser = argparse.ArgumentParser(description='Print lines matching a regex pattern.')
+    parser.add_argument('pattern')
+    parser.add_argument('files', nargs='*', help='files to read, stdin if none or -')
+    parser.add_argument('-x', '--line-regexp', action='store_true', help='match whole lines only')
+    parser.add_argument('-v', '--invert-match', action='store_true', help='select non-matching lines')
+    parser.add_argument('-c', '--count', action='store_true', help='print the number of selected lines')
+    parser.add_argument('-n', '--line-number', action='store_true', help='prefix lines with line numbers')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--stats', action='store_true',
+                        help='print compile stats and match counters to stderr (counters cover -j 1 only)')
+    args = parser.parse_args(argv)
+
+    # Like grep: errors are reported to stderr and make the exit status
+    # 2, a file that cannot be read does not stop the others, and output
+    # closed early (e.g. piped into head) just ends the run.
+    try:
+        matcher = compile_regex(args.pattern, engine='table', minimize=True, stats=args.stats)
+    except (syntax.ParseError, CompileLimitError) as e:
+        print('regex.py: %s' % e, file=sys.stderr)
+        return 2
+    options = GrepOptions(not args.line_regexp, args.invert_match, args.count, args.line_number)
+    files = args.files or ['-']
+    if out is None:
+        out = sys.stdout.buffer
+    executor = None
+    if args.jobs > 1:
+        # workers only see bytes
+        bytes_matcher = matcher.for_input(b'')
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.jobs, initializer=init_worker,
+            initargs=(bytes_matcher.to_bytes(), bytes_matcher.prefilter))
+    n_selected = 0
+    errors = False
+    try:
+        for path in files:
+            label = path if len(files) > 1 else None
+            try:
+                f = sys.stdin.buffer if path == '-' else open(path, 'rb')
+                try:
+                    if executor:
+                        n_selected += grep_file_parallel(executor, args.jobs, None if path == '-' else path,
+                                                         f, out, options, label)
+                    else:
+                        n_selected += grep_file(matcher, f, out, *options, label=label)
+                finally:
+                    if f is not sys.stdin.buffer:
+                        f.close()
+            except BrokenPipeError:
+                raise
+            except OSError as e:
+                print('regex.py: %s: %s' % (path, e.strerror or e), file=sys.stderr)
+                errors = True
+        out.flush()
+    except BrokenPipeError:
+        if out is sys.stdout.buffer:
+            # so that the interpreter does not fail flushing it at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        # some output was written, and read as far as the reader wanted
+        return 2 if errors else 0
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    if args.stats:
+        report = dict(matcher.stats, counters=matcher.match_counters.as_dict(), selected_lines=n_selected)
+        print(json.dumps(report, sort_keys=True, indent=1), file=sys.stderr)
+    return 2 if errors else 0 if n_selected else 1
 
 if __name__ == '__main__':
-    import sys
-    dfa = compile_regex(sys.argv[1])
-    for line in sys.stdin:
-        line = line.rstrip('\n')
-        if dfa.match(line):
-            print(line)
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# Matching a string against many patterns at once.
+#
+# The NFAs of all patterns are joined under one initial state and run as a
+# single lazy DFA, whose states remember which patterns' accept states they
+# contain, so one pass over the input finds every matching pattern. As
+# with automata.LazyDFA, only the states the input reaches are built and
+# at most max_states of them are kept.
+
+import automata
+import charset
+import syntax
+
+class RegexSet(automata.LazyDFA):
+    def __init__(self, patterns, search=False, max_states=1000):
+        # with search, a pattern matches if it matches any substring,
+        # otherwise it has to match the whole string
+        self.patterns = list(patterns)
+        self.accept_ids = {}
+        init_state = automata.NFAState()
+        asts = [syntax.parse(pattern) for pattern in self.patterns]
+        # all NFAs on the same char classes
+        classes = charset.classes([intervals for ast in asts for intervals in syntax.char_sets(ast)])
+        for i, ast in enumerate(asts):
+            nfa = automata.NFA.from_ast(ast, classes)
+            init_state.transitions[None].add(nfa.init_state)
+            self.accept_ids[nfa.accept_state] = i
+        nfa = automata.NFA(init_state=init_state)
+        nfa.alphabet = classes.alphabet
+        nfa.epsilon_elimination()
+        super().__init__(nfa, max_states=max_states, unanchored=search)
+
+    def accepting(self, nfas):
+        return frozenset([self.accept_ids[state] for state in nfas if state in self.accept_ids])
+
+    def match(self, s):
+        return len(self.matches(s)) > 0
+
+    def matches(self, s):
+        # indices of the matching patterns, in ascending order
+        charset.require_str(s, 'RegexSet')
+        if self.thrashing:
+            return self.simulate(s, self.start_nfas, set(self.accepting(self.start_nfas)))
+        alphabet = self.nfa.alphabet
+        state = self.init_state
+        matched = set(state.accept)
+        for pos, c in enumerate(s):
+            char_class = alphabet[c]
+            if char_class in state.transitions:
+                state = state.transitions[char_class]
+            else:
+                state = self.add_transition(state, char_class, self.scanned + pos)
+                if self.thrashing and state is not None:
+                    self.scanned += pos + 1
+                    matched |= state.accept
+                    return self.simulate(s[(pos+1):], state.nfa_states, matched)
+            if state is None:
+                self.scanned += pos + 1
+                return []
+            if self.unanchored and state.accept:
+                matched |= state.accept
+        self.scanned += len(s)
+        if self.unanchored:
+            return sorted(matched)
+        return sorted(state.accept)
+
+    def simulate(self, s, states, matched):
+        alphabet = self.nfa.alphabet
+        for c in s:
+            char_class = alphabet[c]
+            next_states = set()
+            for state in states:
+                next_states.update(state.transitions.get(char_class, ()))
+            if self.unanchored:
+                next_states |= self.start_nfas
+                matched |= self.accepting(next_states)
+            elif not next_states:
+                return []
+            states = next_states
+        if self.unanchored:
+            return sorted(matched)
+        return sorted(self.accepting(states))
@@ -11,12 +11,26 @@
 # TERM -> FACTOR
 # TERM -> TERM FACTOR
 #
-# Writing proper parser is beyond my patience,
-# so writing less generic pseudo-parser thing here.
-# If you are serious, just use yacc or something.
+# parse() below reads a pattern in a single left-to-right pass, keeping
+# an explicit stack of open groups, and reports errors with the position
+# they were found at. Groups are numbered from 1 in the order of their
+# '(', except (?:...) ones. Only with captures=True do they become
+# GroupNodes, which the matching engines other than captures.py do not
+# know about.
+#
+# syntactic_analysis() is the original pseudo-parser on top of
+# lex.lexical_analysis(). It re-scans the tokens for every group, so it
+# is kept only for reference and for comparison in tests.
 
+import charset
 import lex
 
+class ParseError(Exception):
+    def __init__(self, message, pattern, pos):
+        super().__init__('%s at position %d in %r' % (message, pos, pattern))
+        self.pattern = pattern
+        self.pos = pos
+
 class UnionPlaceholder:
     pass
 
@@ -28,10 +42,17 @@ class EpsilonNode(ASTNode):
         return 'Epsilon()'
 
 class CharNode(ASTNode):
-    def __init__(self, char_set):
-        self.char_set = char_set
+    # the chars matched, as code point intervals (see charset.py), given
+    # either directly or as a set of chars
+    def __init__(self, char_set=None, intervals=None):
+        if intervals is None:
+            intervals = charset.from_chars(char_set)
+        self.intervals = intervals
+    @property
+    def char_set(self):
+        return charset.chars(self.intervals)
     def __str__(self):
-        return 'Char(%s)' % (self.char_set)
+        return 'Char(%s)' % charset.to_str(self.intervals)
 
 class ConcatenationNode(ASTNode):
     def __init__(self, children):
@@ -45,6 +66,13 @@ class UnionNode(ASTNode):
     def __str__(self):
         return 'Union(%s)' % (', '.join([str(child) for child in self.children]))
 
+class GroupNode(ASTNode):
+    def __init__(self, index, operand):
+        self.index = index
+        self.operand = operand
+    def __str__(self):
+        return 'Group(%d, %s)' % (self.index, str(self.operand))
+
 class QuantificationNode(ASTNode):
     def __init__(self, lb, ub, operand):
         self.lb = lb
@@ -59,7 +87,7 @@ def decode_char_token(s):
     elif s[0] == '\\':
         char_set = {s[1]}
     elif s[0] == '.':
-        char_set = {chr(x) for x in range(128)}
+        return CharNode(intervals=charset.ANY)
     else:
         char_set = {s[0]}
     return CharNode(char_set)
@@ -201,3 +229,184 @@ def resolve_quantification(nodes):
             node.operand = out.pop(-1)
         out.append(node)
     return out
+
+def parse(pattern, captures=False):
+    return Parser(pattern, captures).parse()
+
+class Parser:
+    def __init__(self, pattern, captures=False):
+        self.pattern = pattern
+        self.captures = captures
+        self.n_groups = 0
+        self.pos = 0
+        # '{' with no '}' after it is an ordinary char, as in lex.py
+        self.last_close = pattern.rfind('}')
+
+    def error(self, message, pos=None):
+        return ParseError(message, self.pattern, self.pos if pos is None else pos)
+
+    def peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def parse(self):
+        # one frame (alternatives, sequence, position of '(', group index
+        # or None) per open group
+        frames = []
+        alternatives = []
+        sequence = []
+        quantifiable = False
+        while self.pos < len(self.pattern):
+            c = self.pattern[self.pos]
+            if c == '(':
+                frames.append((alternatives, sequence, self.pos, self.parse_group_index()))
+                alternatives, sequence = [], []
+                quantifiable = False
+            elif c == ')':
+                if not frames:
+                    raise self.error('unmatched )')
+                node = union_node(alternatives + [concatenation_node(sequence)])
+                alternatives, sequence, _, index = frames.pop()
+                if self.captures and index is not None:
+                    node = GroupNode(index, node)
+                sequence.append(node)
+                quantifiable = True
+                self.pos += 1
+            elif c == '|':
+                alternatives.append(concatenation_node(sequence))
+                sequence = []
+                quantifiable = False
+                self.pos += 1
+            elif c in '*+?' or (c == '{' and self.pos < self.last_close):
+                if not quantifiable:
+                    if sequence:
+                        raise self.error('found contiguous quantification operators')
+                    raise self.error('found quantification operator with no operand')
+                lb, ub = self.parse_quantification()
+                sequence.append(QuantificationNode(lb, ub, sequence.pop()))
+                quantifiable = False
+            else:
+                sequence.append(CharNode(intervals=self.parse_char_set()))
+                quantifiable = True
+        if frames:
+            raise self.error('unmatched (', frames[-1][2])
+        return union_node(alternatives + [concatenation_node(sequence)])
+
+    def parse_group_index(self):
+        # skips '(' or '(?:', returns the group number or None
+        if self.pattern.startswith('?:', self.pos + 1):
+            self.pos += 3
+            return None
+        self.pos += 1
+        self.n_groups += 1
+        return self.n_groups
+
+    def parse_quantification(self):
+        c = self.pattern[self.pos]
+        self.pos += 1
+        if c == '*':
+            return 0, float('inf')
+        elif c == '+':
+            return 1, float('inf')
+        elif c == '?':
+            return 0, 1
+        # {m}, {m,n} or {m,}
+        start = self.pos - 1
+        lb = self.parse_int()
+        ub = lb
+        if self.peek() == ',':
+            self.pos += 1
+            ub = float('inf') if self.peek() == '}' else self.parse_int()
+        if self.peek() != '}':
+            raise self.error('found invalid expression in curly brackets')
+        self.pos += 1
+        if lb is None or ub is None:
+            raise self.error('found invalid expression in curly brackets', start)
+        if lb > ub:
+            raise self.error('found lower bound above upper bound in curly brackets', start)
+        return lb, ub
+
+    def parse_int(self):
+        start = self.pos
+        while self.peek() is not None and self.peek().isdigit():
+            self.pos += 1
+        if start == self.pos:
+            return None
+        return int(self.pattern[start:self.pos])
+
+    def parse_char_set(self):
+        # returns code point intervals
+        c = self.pattern[self.pos]
+        self.pos += 1
+        if c == '.':
+            return charset.ANY
+        elif c == '\\':
+            c = self.parse_escaped()
+        elif c == '[':
+            return self.parse_square_bracket()
+        return ((ord(c), ord(c)),)
+
+    def parse_escaped(self):
+        if self.pos >= len(self.pattern):
+            raise self.error('found trailing backslash', self.pos - 1)
+        c = self.pattern[self.pos]
+        self.pos += 1
+        return c
+
+    def parse_square_bracket(self):
+        start = self.pos - 1
+        intervals = []
+        negated = self.peek() == '^'
+        if negated:
+            self.pos += 1
+        while True:
+            c = self.peek()
+            if c is None:
+                raise self.error('found unmatched square brackets', start)
+            char_pos = self.pos
+            self.pos += 1
+            if c == ']':
+                intervals = charset.normalize(intervals)
+                return charset.negate(intervals) if negated else intervals
+            if c == '\\':
+                c = self.parse_escaped()
+            if self.peek() == '-' and self.pos + 1 < len(self.pattern) and self.pattern[self.pos + 1] != ']':
+                # range notation like 0-9
+                self.pos += 1
+                ub = self.pattern[self.pos]
+                self.pos += 1
+                if ub == '\\':
+                    ub = self.parse_escaped()
+                if c > ub:
+                    raise self.error('invalid range notation (a-b) in square brackets', char_pos)
+                intervals.append((ord(c), ord(ub)))
+            else:
+                # normal chars, including [ and trailing -
+                intervals.append((ord(c), ord(c)))
+
+def char_sets(ast):
+    # the distinct intervals of the CharNodes in ast, in order of appearance
+    found = {}
+    stack = [ast]
+    while stack:
+        ast_node = stack.pop()
+        if type(ast_node) == CharNode:
+            found.setdefault(ast_node.intervals, None)
+        elif type(ast_node) in (QuantificationNode, GroupNode):
+            stack.append(ast_node.operand)
+        elif type(ast_node) in (ConcatenationNode, UnionNode):
+            stack.extend(reversed(ast_node.children))
+    return list(found)
+
+def concatenation_node(nodes):
+    if not nodes:
+        return EpsilonNode()
+    elif len(nodes) == 1:
+        return nodes[0]
+    return ConcatenationNode(nodes)
+
+def union_node(nodes):
+    if len(nodes) == 1:
+        return nodes[0]
+    return UnionNode(nodes)
@@ -0,0 +1,654 @@
+# Compact form of automata.DFA for matching.
+#
+# States are renumbered densely (0 is the dead state, 1 the initial state)
+# and characters are grouped into classes that behave the same way in every
+# state, so the whole DFA becomes a single flat array of
+# n_states * n_classes transitions plus one accept flag per state.
+# Class 0 stands for every character the pattern never mentions.
+#
+# Transitions hold the offset of the destination row (state * n_classes)
+# rather than the state number itself, which saves a multiplication per
+# character in the matching loops.
+
+# TableDFA can be saved to a file and loaded back, optionally through
+# mmap so that processes loading the same file share one copy of the
+# table. The file is laid out as, all integers little-endian:
+#
+#   header      magic 'RXDF', version (u16), flags (u16),
+#               n_states, n_classes, n_segments (u32 each)
+#   alphabet    n_segments pairs of (first code point, class) (i32 each)
+#   transitions n_states * n_classes row offsets (i32 each)
+#   accepts     n_states flags (u8 each)
+#
+# followed by the reverse DFA in the same layout if FLAG_REVERSE is set,
+# then by the UTF-8 DFA for bytes input (see TableDFA.utf8), with its own
+# flags and reverse DFA, if FLAG_UTF8 is set.
+
+import charset
+
+from array import array
+from collections import defaultdict, namedtuple
+import mmap
+import struct
+import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEAD_STATE = 0
+INIT_STATE = 1
+
+MAGIC = b'RXDF'
+VERSION = 2
+FLAG_REVERSE = 1
+FLAG_UTF8 = 2
+HEADER = struct.Struct('<4sHHIII')
+
+# match_many() builds at most about this many classes at once, and
+# matches strings one by one when fewer than MATCH_MANY_ROWS fit, as a
+# numpy step per column costs about as much as that many chars in a loop
+MATCH_MANY_CELLS = 1 << 20
+MATCH_MANY_ROWS = 256
+
+class TooManyStates(Exception):
+    pass
+
+class CompileTimeout(Exception):
+    pass
+
+class CompileLimitError(Exception):
+    def __init__(self, limit, value, maximum, pattern):
+        # limit is the name of the compile_regex() argument that was hit
+        super().__init__('%s %s of %r exceeds %s=%s' % (limit[len('max_'):], value, pattern, limit, maximum))
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+        self.pattern = pattern
+
+# The compile limits that the reverse and unanchored DFAs are built under,
+# when searching first needs them: at most max_states states each, limit
+# being the compile_regex() argument (max_dfa_states or max_memory) that
+# gives it, worth unit per state and set to maximum, and max_compile_time
+# seconds each. Any of them may be None.
+SearchLimits = namedtuple('SearchLimits', ['max_states', 'limit', 'unit', 'maximum', 'max_compile_time', 'pattern'])
+
+class TableDFA:
+    def __init__(self, alphabet, n_classes, transitions, accepts):
+        # alphabet: charset.CharMap of chars to classes
+        self.alphabet = alphabet
+        self.n_classes = n_classes
+        self.transitions = transitions
+        self.accepts = accepts
+        self.n_states = len(accepts)
+        self.init_state = INIT_STATE * n_classes
+        self.reverse_dfa = None
+        self.unanchored_dfa = None
+        # SearchLimits for building those, set by regex.compile_regex
+        self.search_limits = None
+        self.offset_accepts = None
+        # optional literals.Prefilter, set by regex.compile_regex
+        self.prefilter = None
+        # regex.MatchCounters with stats on, counting prefilter rejections
+        self.match_counters = None
+        # Bytes-like input is UTF-8. If the pattern has non-ASCII chars,
+        # utf8 is the TableDFA over bytes that reads it (see
+        # automata.CompactNFA), and all matching methods hand such input
+        # over to it; otherwise bytes are matched with this table.
+        self.utf8 = None
+        # str.translate() and bytes.translate() map a whole input to class
+        # numbers at C speed, so the matching loops only index the table.
+        # str.translate() looks code points up in the alphabet itself.
+        # Bytes are matched natively with a 256-entry class map; byte b
+        # belongs to the same class as chr(b).
+        if n_classes <= 256:
+            self.translation = alphabet
+            self.byte_classes = bytes([alphabet[b] for b in range(256)])
+        else:
+            self.translation = None
+            self.byte_classes = None
+
+    def for_input(self, s):
+        if self.utf8 is not None and not isinstance(s, str):
+            return self.utf8
+        return self
+
+    def classify(self, s):
+        if isinstance(s, str):
+            if self.translation is not None:
+                return s.translate(self.translation).encode('latin-1')
+            alphabet = self.alphabet
+            return [alphabet[c] for c in s]
+        if not isinstance(s, (bytes, bytearray)):
+            s = memoryview(s).cast('B').tobytes()
+        if self.byte_classes is not None:
+            return s.translate(self.byte_classes)
+        alphabet = self.alphabet
+        return [alphabet[b] for b in s]
+
+    def __str__(self):
+        out = '[init: %d, accept: %s, classes: %d]\n' % \
+            (INIT_STATE,
+             '|'.join([str(state) for state in range(self.n_states) if self.accepts[state]]),
+             self.n_classes)
+        classes = [[] for _ in range(self.n_classes)]
+        for first, last, cls in self.alphabet.segments():
+            classes[cls].append((first, last))
+        for cls in range(1, self.n_classes):
+            out += '%d = %s\n' % (cls, charset.to_str(classes[cls]))
+        for state in range(self.n_states):
+            row = self.transitions[(state * self.n_classes):((state + 1) * self.n_classes)]
+            out += '%d: %s\n' % (state, ' '.join([str(dest // self.n_classes) for dest in row]))
+        return out
+
+    @classmethod
+    def from_dfa(cls, dfa):
+        # dense numbering in BFS order from the initial state
+        ids = {dfa.init_state: INIT_STATE}
+        order = [dfa.init_state]
+        for state in order:
+            for dest in state.transitions.values():
+                if dest not in ids:
+                    ids[dest] = len(ids) + 1
+                    order.append(dest)
+        n_states = len(order) + 1
+
+        # classes of the DFA with identical columns are merged, and those
+        # without any transition join class 0
+        dfa_classes = set()
+        for state in order:
+            dfa_classes |= state.transitions.keys()
+        signatures = {}
+        merged = defaultdict(int)
+        for dfa_class in sorted(dfa_classes):
+            signature = tuple([ids[state.transitions[dfa_class]] if dfa_class in state.transitions else DEAD_STATE
+                               for state in order])
+            if signature not in signatures:
+                signatures[signature] = len(signatures) + 1
+            merged[dfa_class] = signatures[signature]
+        alphabet = dfa.alphabet.remap(merged)
+        n_classes = len(signatures) + 1
+
+        transitions = array('i', [DEAD_STATE]) * (n_states * n_classes)
+        for signature, char_class in signatures.items():
+            for state, dest in enumerate(signature, INIT_STATE):
+                transitions[state * n_classes + char_class] = dest * n_classes
+        accepts = bytearray(n_states)
+        for state in dfa.accept_states:
+            if state in ids:
+                accepts[ids[state]] = 1
+        return TableDFA(alphabet, n_classes, transitions, bytes(accepts))
+
+    def is_accept(self, state):
+        return self.accepts[state // self.n_classes] == 1
+
+    def accepts_by_offset(self):
+        # accept flags indexed by row offset, for loops that test every step
+        if self.offset_accepts is None:
+            self.offset_accepts = bytes([accept for accept in self.accepts for _ in range(self.n_classes)])
+        return self.offset_accepts
+
+    def to_bytes(self, with_reverse=True):
+        flags = FLAG_REVERSE if with_reverse else 0
+        if self.utf8 is not None:
+            flags |= FLAG_UTF8
+        alphabet = array('i')
+        for start, cls in zip(self.alphabet.starts, self.alphabet.values):
+            alphabet.append(start)
+            alphabet.append(cls)
+        transitions = array('i', self.transitions)
+        if sys.byteorder != 'little':
+            alphabet.byteswap()
+            transitions.byteswap()
+        out = HEADER.pack(MAGIC, VERSION, flags, self.n_states, self.n_classes, len(self.alphabet.starts)) + \
+            alphabet.tobytes() + transitions.tobytes() + bytes(self.accepts)
+        if with_reverse:
+            if self.reverse_dfa is None:
+                self.reverse_dfa = self.search_dfa(self.reverse)
+            out += self.reverse_dfa.to_bytes(with_reverse=False)
+        if self.utf8 is not None:
+            out += self.utf8.to_bytes(with_reverse)
+        return out
+
+    @classmethod
+    def from_bytes(cls, buf, offset=0):
+        # Tables are used in place when buf is a memoryview in native
+        # (little-endian) byte order, and copied otherwise.
+        dfa, _ = TableDFA.read_section(memoryview(buf), offset)
+        return dfa
+
+    @classmethod
+    def read_section(cls, buf, offset):
+        # the DFA at offset, with the sections that follow it, and the
+        # offset where they end
+        if len(buf) - offset < HEADER.size:
+            raise Exception('truncated compiled regex')
+        magic, version, flags, n_states, n_classes, n_segments = HEADER.unpack_from(buf, offset)
+        if magic != MAGIC:
+            raise Exception('not a compiled regex')
+        if version != VERSION:
+            raise Exception('unsupported compiled regex version: %d' % version)
+        if flags & ~(FLAG_REVERSE | FLAG_UTF8):
+            raise Exception('unsupported compiled regex flags: %d' % flags)
+        alphabet_start = offset + HEADER.size
+        transitions_start = alphabet_start + 8 * n_segments
+        accepts_start = transitions_start + 4 * n_states * n_classes
+        end = accepts_start + n_states
+        if len(buf) < end:
+            raise Exception('truncated compiled regex')
+        alphabet = array('i')
+        alphabet.frombytes(buf[alphabet_start:transitions_start])
+        if sys.byteorder == 'little':
+            transitions = buf[transitions_start:accepts_start].cast('i')
+        else:
+            transitions = array('i')
+            transitions.frombytes(buf[transitions_start:accepts_start])
+            alphabet.byteswap()
+            transitions.byteswap()
+        accepts = buf[accepts_start:end]
+        dfa = TableDFA(charset.CharMap(alphabet[0::2], alphabet[1::2]), n_classes, transitions, accepts)
+        if flags & FLAG_REVERSE:
+            dfa.reverse_dfa, end = TableDFA.read_section(buf, end)
+        if flags & FLAG_UTF8:
+            dfa.utf8, end = TableDFA.read_section(buf, end)
+        return dfa, end
+
+    def save(self, path, with_reverse=True):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes(with_reverse))
+
+    @classmethod
+    def load(cls, path, use_mmap=True):
+        with open(path, 'rb') as f:
+            if use_mmap:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = f.read()
+        return TableDFA.from_bytes(buf)
+
+    def fullmatch(self, s):
+        return self.match(s)
+
+    def stream(self):
+        return Stream(self)
+
+    def match(self, s):
+        dfa = self.for_input(s)
+        return dfa.match_classes(dfa.classify(s))
+
+    def match_many(self, strings, lengths=None):
+        # Matches a whole batch of strings. With numpy all strings advance
+        # together, one column of characters per step, each step a single
+        # gather from the transition table; the result is a boolean array.
+        # strings may also be a numpy array of fixed width bytes ('S') or
+        # str ('U'), with lengths defaulting to numpy.char.str_len().
+        # Without numpy it is a plain loop returning a list.
+        if numpy is None:
+            return [self.match(s) for s in strings]
+        if self.utf8 is not None:
+            if isinstance(strings, numpy.ndarray):
+                if strings.dtype.kind == 'S':
+                    return self.utf8.match_many(strings, lengths)
+            else:
+                strings = list(strings)
+                if strings and not isinstance(strings[0], str):
+                    return self.utf8.match_many(strings, lengths)
+        if isinstance(strings, numpy.ndarray):
+            if lengths is None:
+                lengths = numpy.char.str_len(strings)
+            lengths = numpy.asarray(lengths)
+            # the array is already as wide as its longest string
+            rows = max(1, MATCH_MANY_CELLS // max(1, strings.dtype.itemsize))
+            result = numpy.zeros(len(strings), dtype=bool)
+            for first in range(0, len(strings), rows):
+                chunk = slice(first, first + rows)
+                result[chunk] = self.match_rows(self.classify_array(strings[chunk]), lengths[chunk])
+            return result
+        strings = list(strings)
+        if self.byte_classes is None:
+            return numpy.array([self.match(s) for s in strings], dtype=bool)
+        # All strings classified by a single translate(), then cut into
+        # rows padded by whatever follows them. Rows are taken shortest
+        # first, in chunks of about MATCH_MANY_CELLS classes, so a few long
+        # strings do not widen the rows of all the others.
+        lengths = numpy.array([len(s) for s in strings], dtype=numpy.int64)
+        joined = strings[0][:0].join(strings) if strings else b''
+        flat = numpy.frombuffer(self.classify(joined) + b'\0', dtype=numpy.uint8)
+        starts = numpy.cumsum(lengths) - lengths
+        order = numpy.argsort(lengths, kind='stable')
+        sorted_lengths = lengths[order]
+        result = numpy.zeros(len(strings), dtype=bool)
+        first = 0
+        while first < len(strings):
+            # the chunk is as wide as its last row
+            widths = numpy.maximum(sorted_lengths[first:first + MATCH_MANY_CELLS], 1)
+            cells = numpy.arange(1, len(widths) + 1) * widths
+            end = first + max(1, int(numpy.searchsorted(cells, MATCH_MANY_CELLS, side='right')))
+            rows = order[first:end]
+            if end - first < MATCH_MANY_ROWS:
+                result[rows] = [self.match(strings[row]) for row in rows]
+            else:
+                width = int(sorted_lengths[end - 1])
+                classes = flat[numpy.minimum(starts[rows, None] + numpy.arange(width), len(flat) - 1)]
+                result[rows] = self.match_rows(classes, lengths[rows])
+            first = end
+        return result
+
+    def match_rows(self, classes, lengths):
+        # classes: one row per string, padded past its length
+        transitions = numpy.asarray(self.transitions, dtype=numpy.int64)
+        # column by column is contiguous after the transpose
+        columns = numpy.ascontiguousarray(classes.T, dtype=numpy.int64)
+        states = numpy.full(len(lengths), self.init_state, dtype=numpy.int64)
+        for position, column in enumerate(columns):
+            active = lengths > position
+            if not active.any():
+                break
+            states = numpy.where(active, transitions[states + column], states)
+            # the dead state only leads to itself
+            if not states.any():
+                break
+        accepts = numpy.frombuffer(self.accepts_by_offset(), dtype=numpy.uint8)
+        return accepts[states] == 1
+
+    def classify_array(self, strings):
+        # fixed width numpy array to a 2d array of classes, by byte lookup
+        # or by binary search of the code points among the segments of the
+        # alphabet
+        if strings.dtype.kind == 'S':
+            codes = strings.view(numpy.uint8).reshape(len(strings), strings.dtype.itemsize)
+            if self.byte_classes is not None:
+                return numpy.frombuffer(self.byte_classes, dtype=numpy.uint8)[codes]
+        elif strings.dtype.kind == 'U':
+            codes = strings.view(numpy.uint32).reshape(len(strings), strings.dtype.itemsize // 4)
+        else:
+            raise Exception('match_many: unsupported array dtype %s' % strings.dtype)
+        starts = numpy.array(self.alphabet.starts, dtype=numpy.int64)
+        values = numpy.array(self.alphabet.values, dtype=numpy.int32)
+        return values[numpy.searchsorted(starts, codes, side='right') - 1]
+
+    def match_classes(self, classes):
+        transitions = self.transitions
+        state = self.init_state
+        for cls in classes:
+            state = transitions[state + cls]
+            if state == DEAD_STATE:
+                return False
+        return self.accepts[state // self.n_classes] == 1
+
+    # Unanchored search. A backward pass with the reverse DFA marks every
+    # position where some match starts, then a forward pass from the
+    # leftmost such position finds the longest match, so matches are
+    # leftmost-longest as in POSIX. The backward pass is linear, but each
+    # forward pass runs until the DFA dies, possibly well past the end of
+    # its match, and the next one starts over from that end: finding all
+    # matches takes O(len(s) ** 2) time in the worst case, e.g. a|a*b
+    # over a long run of a's.
+
+    # Both are built on first use, by search_dfa(), as each can have
+    # exponentially more states than this DFA.
+
+    def reverse(self, max_states=None, deadline=None):
+        # DFA for the reversed language, preceded by an implicit .*. Its
+        # states accept whenever the text read so far (backwards) starts a
+        # match.
+        start = [state for state in range(self.n_states) if self.accepts[state]]
+        return self.subset_construction(self.neighbours(backwards=True), start,
+                                        lambda subset: INIT_STATE in subset, max_states, deadline)
+
+    def unanchored(self, max_states=None, deadline=None):
+        # DFA for .* followed by this language. Its states accept whenever
+        # the text read so far ends with a match.
+        accepting = {state for state in range(self.n_states) if self.accepts[state]}
+        return self.subset_construction(self.neighbours(), [INIT_STATE],
+                                        lambda subset: not accepting.isdisjoint(subset), max_states, deadline)
+
+    def search_dfa(self, build):
+        # build is reverse or unanchored, run within self.search_limits
+        limits = self.search_limits
+        if limits is None:
+            return build()
+        start_time = time.perf_counter()
+        deadline = None
+        if limits.max_compile_time is not None:
+            deadline = start_time + limits.max_compile_time
+        try:
+            return build(limits.max_states, deadline)
+        except TooManyStates:
+            raise CompileLimitError(limits.limit, (limits.max_states + 1) * limits.unit, limits.maximum,
+                                    limits.pattern)
+        except CompileTimeout:
+            raise CompileLimitError('max_compile_time', time.perf_counter() - start_time, limits.max_compile_time,
+                                    limits.pattern)
+
+    def neighbours(self, backwards=False):
+        n_classes = self.n_classes
+        neighbours = [defaultdict(list) for _ in range(n_classes)]
+        for state in range(INIT_STATE, self.n_states):
+            for cls in range(n_classes):
+                dest = self.transitions[state * n_classes + cls] // n_classes
+                if dest == DEAD_STATE:
+                    continue
+                if backwards:
+                    neighbours[cls][dest].append(state)
+                else:
+                    neighbours[cls][state].append(dest)
+        return neighbours
+
+    def subset_construction(self, neighbours, start, accepting, max_states=None, deadline=None):
+        # The start states are added back after every step, which is what
+        # the implicit leading .* amounts to.
+        n_classes = self.n_classes
+        start = frozenset(start)
+        ids = {start: INIT_STATE}
+        order = [start]
+        rows = [[DEAD_STATE] * n_classes]
+        for subset in order:
+            if deadline is not None and time.perf_counter() > deadline:
+                raise CompileTimeout('DFA construction ran out of time with %d states' % len(order))
+            row = []
+            for cls in range(n_classes):
+                next_subset = set(start)
+                for state in subset:
+                    next_subset.update(neighbours[cls].get(state, ()))
+                next_subset = frozenset(next_subset)
+                if next_subset not in ids:
+                    if max_states is not None and len(ids) >= max_states:
+                        raise TooManyStates('DFA has more than %d states' % max_states)
+                    ids[next_subset] = len(ids) + 1
+                    order.append(next_subset)
+                row.append(ids[next_subset] * n_classes)
+            rows.append(row)
+        transitions = array('i', [dest for row in rows for dest in row])
+        accepts = bytes([0] + [1 if accepting(subset) else 0 for subset in order])
+        return TableDFA(self.alphabet, n_classes, transitions, accepts)
+
+    def match_starts(self, classes):
+        if self.reverse_dfa is None:
+            self.reverse_dfa = self.search_dfa(self.reverse)
+        transitions = self.reverse_dfa.transitions
+        accepts = self.reverse_dfa.accepts
+        n_classes = self.n_classes
+        state = self.reverse_dfa.init_state
+        starts = bytearray(len(classes) + 1)
+        starts[len(classes)] = accepts[state // n_classes]
+        for pos in range(len(classes) - 1, -1, -1):
+            state = transitions[state + classes[pos]]
+            starts[pos] = accepts[state // n_classes]
+        return starts
+
+    def longest_match(self, classes, start):
+        transitions = self.transitions
+        accepts = self.accepts
+        n_classes = self.n_classes
+        state = self.init_state
+        end = start if accepts[state // n_classes] else None
+        for pos in range(start, len(classes)):
+            state = transitions[state + classes[pos]]
+            if state == DEAD_STATE:
+                break
+            if accepts[state // n_classes]:
+                end = pos + 1
+        return end
+
+    def literals_for(self, s):
+        if self.prefilter is None or not isinstance(s, (str, bytes, bytearray)):
+            return None, None
+        return self.prefilter.literals_for(s)
+
+    def search(self, s):
+        return next(self.finditer(s), None)
+
+    def finditer(self, s):
+        if self.for_input(s) is not self:
+            yield from self.utf8.finditer(s)
+            return
+        required, prefixes = self.literals_for(s)
+        if required and s.find(required) < 0:
+            if self.match_counters is not None:
+                self.match_counters.rejections += 1
+            return
+        # Every match starts with one of prefixes, so the text before the
+        # first of them is skipped. Only the region is narrowed: trying
+        # each later occurrence with its own forward pass would take
+        # quadratic time over a run of failing candidates.
+        offset = 0
+        if prefixes is not None:
+            hits = [hit for hit in [s.find(prefix) for prefix in prefixes] if hit >= 0]
+            if not hits:
+                if self.match_counters is not None:
+                    self.match_counters.rejections += 1
+                return
+            offset = min(hits)
+            s = s[offset:]
+        classes = self.classify(s)
+        starts = self.match_starts(classes)
+        pos = 0
+        while True:
+            start = starts.find(1, pos)
+            if start < 0:
+                return
+            end = self.longest_match(classes, start)
+            yield (offset + start, offset + end)
+            pos = end if end > start else end + 1
+
+    def findall(self, s):
+        return [s[start:end] for start, end in self.finditer(s)]
+
+    def scan_lines(self, buf, search=False, invert=False):
+        # grep over a buffer of newline separated lines. Each line is run
+        # through the DFA (or, for search, the .*-prefixed DFA) until it
+        # is decided, then the scan skips to the next newline with find().
+        # With a required literal, lines without it are decided by find()
+        # alone, and unless inverted are not even visited.
+        # Returns the selected lines as (index, start, end) with end before
+        # the newline, and the number of lines in buf.
+        if self.for_input(buf) is not self:
+            return self.utf8.scan_lines(buf, search, invert)
+        if search:
+            if self.unanchored_dfa is None:
+                self.unanchored_dfa = self.search_dfa(self.unanchored)
+            dfa = self.unanchored_dfa
+        else:
+            dfa = self
+        # a list hands back existing int objects where an array would
+        # create a new one on every lookup
+        transitions = list(dfa.transitions)
+        accepts = dfa.accepts_by_offset()
+        init_state = dfa.init_state
+        newline = b'\n' if isinstance(buf, (bytes, bytearray)) else '\n'
+        required, _ = self.literals_for(buf)
+        classes = self.classify(buf)
+        counters = self.match_counters
+
+        def line_matches(start, end):
+            if required and buf.find(required, start, end) < 0:
+                if counters is not None:
+                    counters.rejections += 1
+                return False
+            state = init_state
+            if search:
+                if accepts[state]:
+                    return True
+                for cls in classes[start:end]:
+                    state = transitions[state + cls]
+                    if accepts[state]:
+                        return True
+                return False
+            for cls in classes[start:end]:
+                state = transitions[state + cls]
+                if state == DEAD_STATE:
+                    return False
+            return accepts[state] == 1
+
+        n_lines = buf.count(newline)
+        if buf and not buf.endswith(newline):
+            n_lines += 1
+        selected = []
+        if required and not invert:
+            index = 0
+            pos = 0
+            visited = 0
+            while True:
+                hit = buf.find(required, pos)
+                if hit < 0:
+                    break
+                start = buf.rfind(newline, pos, hit) + 1 or pos
+                end = buf.find(newline, hit)
+                if end < 0:
+                    end = len(buf)
+                index += buf.count(newline, pos, start)
+                if line_matches(start, end):
+                    selected.append((index, start, end))
+                index += 1
+                visited += 1
+                pos = end + 1
+            if counters is not None:
+                # lines without the literal were never visited
+                counters.rejections += n_lines - visited
+            return selected, n_lines
+        start = 0
+        for index in range(n_lines):
+            end = buf.find(newline, start)
+            if end < 0:
+                end = len(buf)
+            if line_matches(start, end) != invert:
+                selected.append((index, start, end))
+            start = end + 1
+        return selected, n_lines
+
+class Stream: # full match over input that arrives in chunks
+    def __init__(self, dfa):
+        # bytes chunks go to dfa.utf8, if any, which carries UTF-8
+        # sequences split between chunks over in its state
+        self.table_dfa = dfa
+        self.reset()
+
+    def reset(self):
+        self.dfa = None
+        self.state = self.table_dfa.init_state
+
+    def feed(self, chunk):
+        # Returns False once the input can no longer match, so the caller
+        # can stop reading.
+        if self.dfa is None:
+            self.dfa = self.table_dfa.for_input(chunk)
+            self.state = self.dfa.init_state
+        if self.state == DEAD_STATE:
+            return False
+        transitions = self.dfa.transitions
+        state = self.state
+        for cls in self.dfa.classify(chunk):
+            state = transitions[state + cls]
+            if state == DEAD_STATE:
+                break
+        self.state = state
+        return state != DEAD_STATE
+
+    def is_accepting(self):
+        return (self.dfa or self.table_dfa).is_accept(self.state)
+
+    def is_dead(self):
+        return self.state == DEAD_STATE
@@ -0,0 +1,101 @@
+import aio
+import regex
+import asyncio
+import concurrent.futures
+import threading
+import unittest
+
+class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+        self.release = threading.Event()
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        def blocked():
+            # keeps the compilation pending while others ask for it
+            self.release.wait(5)
+            return fn(*args, **kwargs)
+        return super().submit(blocked)
+
+def make_reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+class TestCompileAsync(unittest.IsolatedAsyncioTestCase):
+    async def test_compile(self):
+        matcher = await aio.compile_async('a(b|c)*', engine='table', cache=False)
+        self.assertTrue(matcher.match('abcb'))
+        self.assertFalse(matcher.match('abd'))
+
+    async def test_dedupe(self):
+        executor = CountingExecutor()
+        tasks = [asyncio.ensure_future(aio.compile_async('x[a-z]{3}y', executor=executor, cache=False))
+                 for _ in range(5)]
+        other = asyncio.ensure_future(aio.compile_async('x[a-z]{3}z', executor=executor, cache=False))
+        await asyncio.sleep(0.01)
+        executor.release.set()
+        matchers = await asyncio.gather(*tasks)
+        self.assertEqual(executor.submitted, 2)
+        self.assertTrue(all([matcher is matchers[0] for matcher in matchers]))
+        self.assertTrue((await other).match('xabcz'))
+        self.assertEqual(aio.pending, {})
+        executor.shutdown()
+
+    async def test_cancel(self):
+        executor = CountingExecutor()
+        first = asyncio.ensure_future(aio.compile_async('ab+', executor=executor, cache=False))
+        second = asyncio.ensure_future(aio.compile_async('ab+', executor=executor, cache=False))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        executor.release.set()
+        self.assertTrue((await second).match('abb'))
+        self.assertTrue(first.cancelled())
+        executor.shutdown()
+
+    async def test_error(self):
+        with self.assertRaises(regex.RepetitionTooLarge):
+            await aio.compile_async('a{5000}', cache=False)
+
+class TestFilterLines(unittest.IsolatedAsyncioTestCase):
+    async def collect(self, data, *args, **kwargs):
+        return [line async for line in aio.filter_lines(make_reader(data), *args, **kwargs)]
+
+    async def test_filter(self):
+        matcher = regex.compile_regex('fo+', engine='table', cache=False)
+        data = b'foo\nbar\nxfooo\n\nbaz\nfo'
+        for batch_size in [1, 3, 7, 1 << 16]:
+            self.assertEqual(await self.collect(data, matcher, batch_size=batch_size), [b'foo', b'xfooo', b'fo'])
+            self.assertEqual(await self.collect(data, matcher, search=False, batch_size=batch_size), [b'foo', b'fo'])
+            self.assertEqual(await self.collect(data, matcher, invert=True, batch_size=batch_size),
+                             [b'bar', b'', b'baz'])
+
+    async def test_dfa_and_utf8(self):
+        matcher = regex.compile_regex('a.b', engine='dfa', cache=False)
+        data = 'aéb\naab\nab\n'.encode()
+        self.assertEqual(await self.collect(data, matcher, search=False), ['aéb'.encode(), b'aab'])
+        with self.assertRaises(Exception):
+            await self.collect(data, regex.compile_regex('ab', engine='nfa', cache=False))
+
+    async def test_yields_to_loop(self):
+        matcher = regex.compile_regex('[0-9]*7', engine='table', cache=False)
+        data = b''.join([b'%d\n' % i for i in range(20000)])
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.ensure_future(ticker())
+        lines = await self.collect(data, matcher, search=False, batch_size=1024)
+        task.cancel()
+        self.assertEqual(len(lines), 2000)
+        self.assertGreater(ticks, 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+import bench
+
+import unittest
+
+class TestBench(unittest.TestCase):
+    def test_run(self):
+        results = bench.run(['blowup'], ['auto', 'table', 'bitparallel', 're'], [200], repeat=1)
+        self.assertEqual(bench.mismatches(results), [])
+        records = [record for record in results if record['engine'] == 'table']
+        self.assertEqual(len(records), 2)
+        self.assertGreater(records[0]['dfa_states'], 0)
+        self.assertGreaterEqual(records[0]['input_bytes'], 200)
+        self.assertIn('error', records[1])
+
+    def test_plain_compile(self):
+        # the limits only guard the compile, they add nothing to it
+        matcher = bench.compile_pattern('.{0,20}foo.{0,20}bar.*', 'table')
+        self.assertIsNone(matcher.reverse_dfa)
+        self.assertIsNone(matcher.unanchored_dfa)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import bitparallel
+import regex
+import syntax
+
+import unittest
+
+class TestBitParallel(unittest.TestCase):
+    def compile(self, pattern, max_positions=bitparallel.MAX_POSITIONS):
+        ast = syntax.parse(pattern)
+        return bitparallel.BitParallelMatcher.from_ast(ast, max_positions)
+
+    def test_same_as_dfa(self):
+        import itertools
+        for pattern in ['a{2,4}b*', '(a+b)*c+', '((a?b)*)+', 'a.b', '', '(ab?)+c', '(a*b)+',
+                        '(a|b)*a(a|b){12}']:
+            matcher = self.compile(pattern)
+            dfa = regex.compile_regex(pattern, engine='dfa')
+            strings = [''.join(chars) for n in range(7) for chars in itertools.product('abc', repeat=n)]
+            self.assertEqual(matcher.match_many(strings), [dfa.match(s) for s in strings])
+
+    def test_positions(self):
+        # one position per char occurrence, + and * loop on a single copy
+        self.assertEqual(self.compile('a+b*c').n_positions, 3)
+        self.assertEqual(self.compile('(ab){2,3}').n_positions, 6)
+        self.assertEqual(len(self.compile('(ab){5}c').tables), 1)
+        self.assertEqual(len(self.compile('(ab){6}').tables), 2)
+        with self.assertRaises(bitparallel.TooManyPositions):
+            self.compile('(ab){5}', max_positions=9)
+
+    def test_counters(self):
+        import itertools
+        # single char class repetitions take one position, whatever the bounds
+        self.assertEqual(self.compile('[a-z]{1,1000}').n_positions, 1)
+        self.assertEqual(self.compile('x[a-z]{3,}y').counters, [(2, 3, float('inf'))])
+        for pattern in ['a{2,4}b*', '(a{2,3}b)*', '(a{2,3})*', 'a{0,3}b', 'a{2,}', '(ab){2}a{3,}',
+                        '[ab]{1,4}[bc]{2}', '(a{2})+']:
+            matcher = self.compile(pattern)
+            self.assertNotEqual(matcher.counters, [])
+            dfa = regex.compile_regex(pattern, engine='dfa')
+            strings = [''.join(chars) for n in range(9) for chars in itertools.product('abc', repeat=n)]
+            self.assertEqual(matcher.match_many(strings), [dfa.match(s) for s in strings])
+        matcher = self.compile('x.{0,500}y')
+        self.assertEqual(matcher.match('x' + 'a' * 500 + 'y'), True)
+        self.assertEqual(matcher.match('x' + 'a' * 501 + 'y'), False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import captures
+import regex
+import syntax
+
+import itertools
+import re
+import unittest
+
+# no repetition of a nullable group, where re has its own rules
+PATTERNS = ['(a|ab)(c|bcd)(d*)', '(a*)(b|abc)', '((a)|b)+', '(a+)(a*)', '(a){2,3}', '(?:(a)|(b))*c',
+            '(ab|a)(bc|c)?', '([a-c]+)(b+)?', 'b|ab*', '(a)|b', '']
+
+class TestCaptures(unittest.TestCase):
+    def compile(self, pattern):
+        return captures.CaptureMatcher.from_ast(syntax.parse(pattern, captures=True))
+
+    def expected(self, pattern, s, offset=0):
+        match = re.fullmatch(pattern, s)
+        if match is None:
+            return None
+        return tuple([None if match.span(i) == (-1, -1) else (match.start(i) + offset, match.end(i) + offset)
+                      for i in range(match.re.groups + 1)])
+
+    def test_groups(self):
+        self.assertEqual(self.compile('(a|ab)(c|bcd)(d*)').groups('abcd'), ((0, 4), (0, 1), (1, 4), (4, 4)))
+        self.assertEqual(self.compile('x(y)?z').groups('xz'), ((0, 2), None))
+        self.assertEqual(self.compile('(?:a(b))+').groups('abab'), ((0, 4), (3, 4)))
+        self.assertIsNone(self.compile('(a)b').groups('ac'))
+
+    def test_same_as_re(self):
+        for pattern in PATTERNS:
+            matcher = self.compile(pattern)
+            for n in range(7):
+                for chars in itertools.product('abcd', repeat=n):
+                    s = ''.join(chars)
+                    self.assertEqual(matcher.groups(s), self.expected(pattern, s), (pattern, s))
+
+    def test_search(self):
+        # leftmost-longest like the table DFA, with the groups re would
+        # report for that match
+        for pattern in PATTERNS:
+            matcher = self.compile(pattern)
+            dfa = regex.compile_regex(pattern, engine='table', cache=False)
+            for n in range(6):
+                for chars in itertools.product('abcd', repeat=n):
+                    s = ''.join(chars)
+                    found = list(matcher.finditer_groups(s))
+                    self.assertEqual([spans[0] for spans in found], list(dfa.finditer(s)), (pattern, s))
+                    for spans in found:
+                        start, end = spans[0]
+                        self.assertEqual(spans, self.expected(pattern, s[start:end], start), (pattern, s))
+
+    def test_empty_iterations(self):
+        # unlike re, no empty iteration after the required ones, so groups
+        # keep the spans of the last non-empty iteration, or None
+        for pattern, s, spans, re_spans in [('((a)*)*', '', ((0, 0), None, None), ((0, 0), (0, 0), None)),
+                                            ('(([^a])*)+', 'cbbbdc', ((0, 6), (0, 6), (5, 6)),
+                                             ((0, 6), (6, 6), (5, 6))),
+                                            ('(a|)*', 'aa', ((0, 2), (1, 2)), ((0, 2), (2, 2))),
+                                            ('(a*)+', '', ((0, 0), (0, 0)), ((0, 0), (0, 0))),
+                                            ('(a*){2,}', 'a', ((0, 1), (1, 1)), ((0, 1), (1, 1)))]:
+            self.assertEqual(self.compile(pattern).groups(s), spans, pattern)
+            self.assertEqual(self.expected(pattern, s), re_spans, pattern)
+
+    def test_compile_regex(self):
+        matcher = regex.compile_regex('([0-9]+)-([0-9]+)', engine='captures', cache=False)
+        self.assertEqual(matcher.search_groups('from 10-200 on'), ((5, 11), (5, 7), (8, 11)))
+        self.assertEqual(matcher.findall('1-2 34-5'), ['1-2', '34-5'])
+        self.assertTrue(matcher.match('1-2'))
+        self.assertGreater(matcher.stats['nfa_states'], 0)
+
+    def test_long_input(self):
+        # one pass, whatever the length
+        matcher = self.compile('(a|b)*(b)')
+        self.assertEqual(matcher.groups('ab' * 50000), ((0, 100000), (99998, 99999), (99999, 100000)))
+
+    def test_threads(self):
+        # one shared matcher, each thread with its own buffers
+        import sys
+        import threading
+        matcher = self.compile('(a|b)*(b)c?')
+        inputs = [('ab' * 30, ((0, 60), (58, 59), (59, 60))), ('b' * 41 + 'c', ((0, 42), (39, 40), (40, 41))),
+                  ('a' * 50, None)]
+        errors = []
+
+        def run(s, expected):
+            for _ in range(50):
+                if matcher.groups(s) != expected:
+                    errors.append(s)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=run, args=args) for args in inputs]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -49,6 +49,16 @@ class TestLexicalAnalysis(unittest.TestCase):
         ]
         self.check_tokens(actual_tokens, expected_tokens)
 
+    def test_non_capturing(self):
+        regex = '(?:a)?'
+        actual_tokens = lex.lexical_analysis(regex)
+        expected_tokens = [lex.OpenParToken('(?:'),
+                           lex.CharToken('a'),
+                           lex.CloseParToken(')'),
+                           lex.QuantificationToken('?'),
+        ]
+        self.check_tokens(actual_tokens, expected_tokens)
+
        
 if __name__ == '__main__':
     unittest.main()
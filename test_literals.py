@@ -0,0 +1,71 @@
+import lex
+import literals
+import regex
+import syntax
+
+import itertools
+import unittest
+
+class TestLiterals(unittest.TestCase):
+    def analyze(self, pattern):
+        return literals.analyze(syntax.syntactic_analysis(lex.lexical_analysis(pattern)))
+
+    def prefilter(self, pattern):
+        return literals.Prefilter.from_ast(syntax.syntactic_analysis(lex.lexical_analysis(pattern)))
+
+    def test_analyze(self):
+        self.assertEqual(self.analyze('abc|abd').exact, {'abc', 'abd'})
+        self.assertEqual(self.analyze('a{2,3}b').exact, {'aab', 'aaab'})
+        self.assertEqual(self.analyze('(foo|bar)baz').prefixes, {'foobaz', 'barbaz'})
+        result = self.analyze('ERROR [0-9]+ timeout')
+        self.assertIsNone(result.exact)
+        self.assertEqual(result.prefixes, {'ERROR '})
+        self.assertEqual(result.suffixes, {' timeout'})
+        self.assertEqual(result.required, ' timeout')
+        self.assertEqual(self.analyze('x*abc').required, 'abc')
+        self.assertEqual(self.analyze('x*abc').prefixes, {''})
+
+    def test_prefilter(self):
+        self.assertIsNone(self.prefilter('[a-z]+'))
+        self.assertIsNone(self.prefilter(''))
+        prefilter = self.prefilter('(ab)+c')
+        self.assertEqual(prefilter.required, 'abc')
+        self.assertEqual(prefilter.prefixes, ['ab'])
+        self.assertEqual(prefilter.literals_for(b''), (b'abc', [b'ab']))
+        prefilter = self.prefilter('x*abc')
+        self.assertEqual(prefilter.required, 'abc')
+        self.assertIsNone(prefilter.prefixes)
+
+    def test_same_results(self):
+        # the prefilter may only skip work, never change a result
+        for pattern in ['abc|abd', '(foo|bar)baz', 'x*ab', 'a{2,3}b', '(ab)+c', 'a.c', 'b|ab*']:
+            with_prefilter = regex.compile_regex(pattern, engine='table', cache=False)
+            self.assertIsNotNone(with_prefilter.prefilter)
+            without = regex.compile_regex(pattern, engine='table', cache=False)
+            without.prefilter = None
+            for n in range(7):
+                for chars in itertools.product('abx\n', repeat=n):
+                    s = ''.join(chars)
+                    for buf in [s, s.encode()]:
+                        self.assertEqual(list(with_prefilter.finditer(buf)), list(without.finditer(buf)))
+                        for search, invert in itertools.product([False, True], repeat=2):
+                            self.assertEqual(with_prefilter.scan_lines(buf, search, invert),
+                                             without.scan_lines(buf, search, invert))
+
+    def test_dfa_engine(self):
+        dfa = regex.compile_regex('(foo|bar)baz', engine='dfa', cache=False)
+        self.assertEqual(dfa.compiled().prefilter.prefixes, ['barbaz', 'foobaz'])
+        self.assertEqual(dfa.findall('xbarbazfoobaz foobar'), ['barbaz', 'foobaz'])
+
+    def test_scaling(self):
+        # every a is a failing candidate, which must not cost a pass each
+        import time
+        matcher = regex.compile_regex('a[a-z]*b', engine='table', cache=False)
+        self.assertEqual(matcher.prefilter.prefixes, ['a'])
+        start_time = time.perf_counter()
+        self.assertEqual(matcher.findall('x' + 'a' * 100000), [])
+        self.assertLess(time.perf_counter() - start_time, 5)
+        self.assertEqual(matcher.findall('x' + 'a' * 100000 + 'b'), ['a' * 100000 + 'b'])
+
+if __name__ == '__main__':
+    unittest.main()
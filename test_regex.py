@@ -1,4 +1,6 @@
+import automata
 import regex
+import syntax
 import unittest
 
 class TestMatch(unittest.TestCase):
@@ -31,5 +33,525 @@ class TestMatch(unittest.TestCase):
         self.assertEqual(matcher.match('ab'), False)
         self.assertEqual(matcher.match('axbx'), False)
 
+class TestUnicode(unittest.TestCase):
+    engines = ['dfa', 'table', 'lazy', 'nfa', 'bitparallel', 'captures']
+
+    def test_same_as_re(self):
+        import itertools
+        import re
+        chars = ['a', '\u00e9', '\u4e00', '\U0001f600']
+        for pattern in ['a.b', '[^a]+', '\u00e9|\u4e00*', '[\u00e0-\u00ff\U0001f000-\U0001ffff]a?', '.[^\u4e00]']:
+            for engine in self.engines:
+                matcher = regex.compile_regex(pattern, engine=engine, cache=False)
+                for n in range(4):
+                    for s in itertools.product(chars + ['b'], repeat=n):
+                        s = ''.join(s)
+                        self.assertEqual(bool(matcher.match(s)), re.fullmatch(pattern, s) is not None,
+                                         (pattern, engine, s))
+
+    def test_utf8_bytes(self):
+        # bytes are UTF-8, so . reads a whole multi-byte char
+        for engine in ['dfa', 'table']:
+            matcher = regex.compile_regex('a.b|\u00e9+', engine=engine, cache=False)
+            self.assertTrue(matcher.match('a\u4e00b'.encode()))
+            self.assertFalse(matcher.match('a\u4e00\u4e00b'.encode()))
+            self.assertTrue(matcher.match('\u00e9\u00e9'.encode()))
+            self.assertFalse(matcher.match(b'\xe9'))
+            self.assertEqual(matcher.findall('x\u00e9a\U0001f600b'.encode()), ['\u00e9'.encode(), 'a\U0001f600b'.encode()])
+            stream = matcher.compiled().stream() if engine == 'dfa' else matcher.stream()
+            for chunk in [b'a\xe4', b'\xb8', b'\x80b']:
+                stream.feed(chunk)
+            self.assertTrue(stream.is_accepting())
+        # the other engines would read bytes as Latin-1, so refuse them
+        for engine in ['lazy', 'nfa', 'bitparallel', 'captures']:
+            matcher = regex.compile_regex('\u00e9{1,150}', engine=engine, cache=False)
+            self.assertTrue(matcher.match('\u00e9\u00e9'))
+            with self.assertRaises(TypeError):
+                matcher.match('\u00e9\u00e9'.encode())
+        # ASCII patterns need no second DFA
+        self.assertIsNone(regex.compile_regex('a[bc]', engine='table', cache=False).utf8)
+
+    def test_size(self):
+        # compile time and DFA size depend on ranges, not code points
+        matcher = regex.compile_regex('[^a]{3}', engine='table', cache=False)
+        self.assertEqual(matcher.stats['dfa_states'], 4)
+        self.assertLess(matcher.stats['utf8_dfa_states'], 40)
+        self.assertEqual(matcher.n_classes, 2)
+        self.assertLessEqual(matcher.utf8.n_classes, 16)
+
+    def test_bounded_caches(self):
+        # memory does not grow with the distinct chars of the input
+        import charset
+        s = ''.join([chr(0x4e00 + i) for i in range(5000)]) + 'a' + '\u00e9' * 6
+        matcher = regex.compile_regex('.*x', engine='table', cache=False)
+        self.assertFalse(matcher.match(s))
+        self.assertEqual(list(matcher.finditer(s)), [])
+        self.assertTrue(all([(key if isinstance(key, int) else ord(key)) < charset.CACHE_LIMIT
+                             for key in matcher.alphabet]))
+        for engine in ['lazy', 'nfa']:
+            self.assertTrue(regex.compile_regex('(.)*a.{6}', engine=engine, cache=False).match(s))
+        lazy = regex.compile_regex('(.)*a.{6}', engine='lazy', cache=False)
+        lazy.match(s)
+        self.assertLessEqual(max([len(state.transitions) for state in lazy.enum_states()]), 2)
+
+class TestLazyMatch(unittest.TestCase):
+    def test_same_as_dfa(self):
+        for pattern, strings in [('a{2,4}b*', ['abb', 'aaa', 'aaabb', 'aaaaabb']),
+                                 ('(a+b)*c+', ['aababc', 'c', 'aaaabab']),
+                                 ('((a?b)*)+', ['', 'bab', 'aab'])]:
+            dfa = regex.compile_regex(pattern)
+            lazy = regex.compile_regex(pattern, engine='lazy')
+            for s in strings:
+                self.assertEqual(lazy.match(s), dfa.match(s))
+        # compared to the full DFA of the same NFA
+        self.assertLessEqual(len(lazy.enum_states()), len(automata.DFA.from_nfa(lazy.nfa).enum_states()))
+
+    def test_bounded_cache(self):
+        pattern = '(a|b)*a(a|b){20}'
+        matcher = regex.compile_regex(pattern, engine='lazy', max_states=16, cache=False)
+        self.assertEqual(matcher.match('b' * 10 + 'a' + 'b' * 20), True)
+        self.assertEqual(matcher.match('b' * 10 + 'a' + 'b' * 19), False)
+        self.assertLessEqual(len(matcher.enum_states()), 16)
+        self.assertGreater(matcher.flushes, 0)
+
+    def test_thrashing_falls_back_to_nfa(self):
+        pattern = '(a|b)*a(a|b){8}'
+        matcher = regex.compile_regex(pattern, engine='lazy', max_states=4, cache=False)
+        for _ in range(10):
+            self.assertEqual(matcher.match('abababbbaab' * 3), True)
+            self.assertEqual(matcher.match('abababbbaab' * 3 + 'b' * 9), False)
+        self.assertEqual(matcher.thrashing, True)
+        self.assertEqual(matcher.match('a' * 9), True)
+        self.assertEqual(matcher.match('a' * 8), False)
+
+class TestCompactNFA(unittest.TestCase):
+    def test_same_as_nfa(self):
+        import itertools
+        for pattern in ['a{2,4}b*', '(a+b)*c+', '((a?b)*)+', 'a.b', '', 'a|', '(a|)*b', '(a|b)*a(a|b){2}']:
+            ast = syntax.parse(pattern)
+            nfa = automata.NFA.from_ast(ast)
+            nfa.epsilon_elimination()
+            compact_nfa = automata.CompactNFA.from_ast(ast)
+            dfa = compact_nfa.to_dfa()
+            for n in range(6):
+                for chars in itertools.product('abc', repeat=n):
+                    s = ''.join(chars)
+                    self.assertEqual(compact_nfa.match(s), nfa.match(s))
+                    self.assertEqual(dfa.match(s), nfa.match(s))
+
+    def test_layout(self):
+        compact_nfa = automata.CompactNFA.from_ast(syntax.parse('a[bc]*'))
+        # classes: other, a, [bc]
+        self.assertEqual(compact_nfa.n_classes, 3)
+        self.assertEqual([compact_nfa.alphabet[c] for c in 'abcd'], [1, 2, 2, 0])
+        # only states reading a char, and accept, appear in closures
+        self.assertEqual(len(compact_nfa.start_states), 1)
+        self.assertEqual(len(compact_nfa.follow_offsets), compact_nfa.n_states + 1)
+        with self.assertRaises(automata.TooManyStates):
+            automata.CompactNFA.from_ast(syntax.parse('(a|b)*a(a|b){8}')).to_dfa(max_states=100)
+
+class TestEpsilonClosures(unittest.TestCase):
+    def test_same_as_search(self):
+        import random
+        rng = random.Random(0)
+        for _ in range(50):
+            n_states = rng.randint(1, 30)
+            successors = [rng.sample(range(n_states), rng.randint(0, min(3, n_states))) for _ in range(n_states)]
+            important = [rng.random() < 0.5 for _ in range(n_states)]
+            closures = automata.epsilon_closures(successors, important)
+            for state in range(n_states):
+                reached = {state}
+                stack = [state]
+                while stack:
+                    for dest in successors[stack.pop()]:
+                        if dest not in reached:
+                            reached.add(dest)
+                            stack.append(dest)
+                self.assertEqual(closures[state], tuple(sorted([s for s in reached if important[s]])))
+
+    def test_sharing(self):
+        # 0 -> 1 <-> 2 -> 3: 1 and 2 form one component, 0 adds nothing
+        closures = automata.epsilon_closures([[1], [2], [1, 3], []], [False, True, False, True])
+        self.assertEqual(closures[1], (1, 3))
+        self.assertIs(closures[1], closures[2])
+        self.assertIs(closures[0], closures[1])
+
+    def test_deep(self):
+        n_states = 100000
+        closures = automata.epsilon_closures([[state + 1] for state in range(n_states - 1)] + [[0]])
+        self.assertEqual(len(closures[0]), n_states)
+        self.assertIs(closures[0], closures[-1])
+
+    def test_bits(self):
+        for mask in [0, 1, 0b1011000, (1 << 1000) | 5]:
+            self.assertEqual(automata.to_mask(automata.bits(mask)), mask)
+
+class TestPikeVM(unittest.TestCase):
+    def test_same_as_dfa(self):
+        import itertools
+        for pattern in ['a{2,4}b*', '(a+b)*c+', '((a?b)*)+', 'a.b', '(a|b)*a(a|b){2}']:
+            dfa = regex.compile_regex(pattern, engine='dfa')
+            vm = regex.compile_regex(pattern, engine='nfa')
+            for n in range(6):
+                for chars in itertools.product('abc', repeat=n):
+                    s = ''.join(chars)
+                    self.assertEqual(vm.match(s), dfa.match(s))
+
+    def test_auto(self):
+        self.assertEqual(regex.compile_regex('a{2,4}b*', engine='auto').stats['engine'], 'dfa')
+        matcher = regex.compile_regex('(a|b)*a(a|b){20}', engine='auto')
+        self.assertEqual(matcher.stats['engine'], 'bitparallel')
+        self.assertEqual(matcher.match('b' * 10 + 'a' + 'b' * 20), True)
+        self.assertEqual(matcher.match('b' * 10 + 'a' + 'b' * 19), False)
+        matcher = regex.compile_regex('(a|b)*a(a|b){40}', engine='auto')
+        self.assertEqual(matcher.stats['engine'], 'nfa')
+        self.assertEqual(matcher.match('b' * 10 + 'a' + 'b' * 40), True)
+        self.assertEqual(matcher.match('b' * 10 + 'a' + 'b' * 39), False)
+
+    def test_sparse_set(self):
+        import automata
+        states = automata.SparseSet(10)
+        for x in [3, 1, 3, 7]:
+            states.add(x)
+        self.assertEqual(list(states), [3, 1, 7])
+        self.assertEqual(5 in states, False)
+        states.clear()
+        self.assertEqual(3 in states, False)
+        states.add(5)
+        self.assertEqual(list(states), [5])
+
+    def test_threads(self):
+        # one cached matcher shared by threads matching different strings
+        import sys
+        import threading
+        matcher = regex.compile_regex('(a|b)*a(a|b){6}', engine='nfa', cache=False)
+        strings = [('ab' * 20 + 'a', True), ('b' * 40, False), ('a' + 'b' * 40, False), ('b' * 30 + 'a' * 7, True)]
+        errors = []
+
+        def run(s, expected):
+            for _ in range(100):
+                if matcher.match(s) != expected:
+                    errors.append(s)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=run, args=args) for args in strings]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+
+class TestCountedRepetition(unittest.TestCase):
+    def test_counted_repetition(self):
+        # large counts skip NFA construction, and are capped
+        matcher = regex.compile_regex('x[a-z]{1,1000}y', engine='auto', cache=False)
+        self.assertEqual(matcher.stats['engine'], 'bitparallel')
+        self.assertEqual(matcher.match('x' + 'q' * 1000 + 'y'), True)
+        self.assertEqual(matcher.match('x' + 'q' * 1001 + 'y'), False)
+        with self.assertRaises(regex.RepetitionTooLarge):
+            regex.compile_regex('a{1001}', cache=False)
+        with self.assertRaises(regex.RepetitionTooLarge):
+            regex.compile_regex('(a{2,}b){50}', cache=False, max_repeat=10)
+        self.assertEqual(regex.compile_regex('a{1001}', cache=False, max_repeat=None).match('a' * 1001), True)
+
+class TestLimits(unittest.TestCase):
+    def test_limits(self):
+        pattern = '(a|b)*a(a|b){12}'
+        for kwargs, limit in [({'max_nfa_states': 10}, 'max_nfa_states'),
+                              ({'max_dfa_states': 100, 'engine': 'dfa'}, 'max_dfa_states'),
+                              ({'max_memory': 100000, 'engine': 'table'}, 'max_memory'),
+                              ({'max_memory': 1000}, 'max_memory'),
+                              ({'max_compile_time': 0.0, 'engine': 'dfa'}, 'max_compile_time'),
+                              ({'max_repeat': 5}, 'max_repeat')]:
+            with self.assertRaises(regex.CompileLimitError) as context:
+                regex.compile_regex(pattern, cache=False, **kwargs)
+            self.assertEqual(context.exception.limit, limit)
+            self.assertEqual(context.exception.pattern, pattern)
+            self.assertGreater(context.exception.value, context.exception.maximum)
+        # auto downgrades instead of building a large DFA
+        pattern = '(a|b)*a(a|b){4}'
+        self.assertEqual(regex.compile_regex(pattern, engine='auto', cache=False, max_dfa_states=10).stats['engine'], 'bitparallel')
+        self.assertEqual(regex.compile_regex(pattern, engine='auto', cache=False, max_dfa_states=100).stats['engine'], 'dfa')
+
+    def test_search_dfas(self):
+        # the reverse and unanchored DFAs are built on first use, within
+        # the limits the pattern was compiled with
+        pattern = '[ac-f](a|b){14}'
+        matcher = regex.compile_regex(pattern, engine='table', cache=False, max_dfa_states=100, max_compile_time=0.5)
+        self.assertIsNone(matcher.unanchored_dfa)
+        self.assertTrue(matcher.match('c' + 'ab' * 7))
+        with self.assertRaises(regex.CompileLimitError) as context:
+            matcher.scan_lines(b'xxab\n', search=True)
+        self.assertEqual(context.exception.limit, 'max_dfa_states')
+        self.assertEqual(context.exception.pattern, pattern)
+        matcher = regex.compile_regex('[ac-f](a|b){18}', engine='dfa', cache=False, max_compile_time=0.2)
+        with self.assertRaises(regex.CompileLimitError) as context:
+            matcher.compiled().scan_lines(b'xxab\n', search=True)
+        self.assertEqual(context.exception.limit, 'max_compile_time')
+        matcher = regex.compile_regex('a[bc\u00e9]*d', engine='dfa', cache=False, max_dfa_states=100)
+        self.assertEqual(matcher.findall('xabdac\u00e9d'), ['abd', 'ac\u00e9d'])
+        self.assertEqual(matcher.compiled().scan_lines('xxac\u00e9d\nab\n'.encode(), search=True), ([(0, 0, 7)], 2))
+        self.assertIsNotNone(matcher.utf8.unanchored_dfa)
+
+    def test_estimate_cost(self):
+        for pattern in ['', 'a', '(ab|c)*d', 'a{2,5}', 'x(a{3,}b)?', 'x|y|']:
+            cost = regex.estimate_cost(pattern)
+            self.assertEqual(cost.nfa_states, automata.CompactNFA.from_ast(syntax.parse(pattern)).n_states)
+        cost = regex.estimate_cost('(a|b)*a(a|b){20}x{1,500}')
+        self.assertEqual(cost.positions, 3 + 2 * 20 + 1)
+        self.assertEqual(cost.repetition_bound, 500)
+        self.assertEqual(cost.memory, cost.nfa_states * regex.NFA_STATE_BYTES)
+
+class TestMinimize(unittest.TestCase):
+    def test_same_language(self):
+        import itertools
+        for pattern in ['a{2,4}b*', '(a+b)*c+', '((a?b)*)+', '(ab|cb)a|(ab|cb)c', '(a|b)*a(a|b){2}']:
+            dfa = regex.compile_regex(pattern)
+            minimized = regex.compile_regex(pattern, minimize=True)
+            for n in range(6):
+                for chars in itertools.product('abc', repeat=n):
+                    s = ''.join(chars)
+                    self.assertEqual(minimized.match(s), dfa.match(s))
+
+    def test_stats(self):
+        matcher = regex.compile_regex('(ab|cb)d|(ab|cb)e', minimize=True)
+        self.assertEqual(matcher.stats['dfa_states'], 5)
+        self.assertEqual(matcher.stats['minimized_dfa_states'], 4)
+        self.assertEqual(len(matcher.enum_states()), 4)
+
+class TestStats(unittest.TestCase):
+    def test_compile_stats(self):
+        matcher = regex.compile_regex('(ab|cb)d|(ab|cb)e', engine='table', minimize=True, cache=False, stats=True)
+        self.assertEqual(sorted(matcher.stats['phases']), ['dfa', 'matcher', 'minimize', 'nfa', 'parse', 'stats', 'table'])
+        self.assertEqual(matcher.stats['dfa_transitions'], 5)
+        self.assertGreater(matcher.stats['nfa_transitions'], 0)
+        self.assertGreater(matcher.stats['peak_memory'], 0)
+        self.assertGreaterEqual(matcher.stats['compile_seconds'], sum(matcher.stats['phases'].values()))
+        lazy = regex.compile_regex('a+b', engine='lazy', cache=False, stats=True)
+        self.assertIn('epsilon_elimination', lazy.stats['phases'])
+        # off by default, and then matching methods are the class ones
+        plain = regex.compile_regex('(ab|cb)d', engine='table', cache=False)
+        self.assertNotIn('phases', plain.stats)
+        self.assertIsNone(plain.match_counters)
+        self.assertNotIn('match', vars(plain))
+
+    def test_match_counters(self):
+        matcher = regex.compile_regex('x[0-9]+y', engine='table', cache=False, stats=True)
+        matcher.match('x12y')
+        matcher.match(b'x1')
+        self.assertEqual(matcher.findall('ab x1y x22y'), ['x1y', 'x22y'])
+        self.assertEqual(matcher.findall('no literal'), [])
+        matcher.scan_lines(b'x1y\nabc\nx\n\ny2\n', search=True)
+        counters = matcher.match_counters.as_dict()
+        self.assertEqual(counters['calls'], {'match': 2, 'findall': 2, 'scan_lines': 1})
+        self.assertEqual(counters['scanned'], 4 + 2 + 11 + 10 + 14)
+        # 'no literal', then the lines without an x
+        self.assertEqual(counters['rejections'], 1 + 3)
+        lazy = regex.compile_regex('(a|b)*c', engine='lazy', cache=False, stats=True)
+        for s in ['abac', 'abac', 'bbc']:
+            self.assertTrue(lazy.match(s))
+        counters = lazy.match_counters.as_dict()
+        self.assertEqual(counters['lazy_cache_hits'] + counters['lazy_cache_misses'], 11)
+        self.assertGreater(counters['lazy_cache_hits'], 0)
+
+    def test_cli_stats(self):
+        import io
+        import json
+        import sys
+        stdin, stderr = sys.stdin, sys.stderr
+        sys.stdin = io.TextIOWrapper(io.BytesIO(b'foo\nbar\nfoo bar\n'))
+        sys.stderr = io.StringIO()
+        out = io.BytesIO()
+        try:
+            regex.main(['--stats', 'fo+'], out=out)
+            report = json.loads(sys.stderr.getvalue())
+        finally:
+            sys.stdin, sys.stderr = stdin, stderr
+        self.assertEqual(out.getvalue(), b'foo\nfoo bar\n')
+        self.assertEqual(report['selected_lines'], 2)
+        self.assertEqual(report['counters']['rejections'], 1)
+        self.assertIn('parse', report['phases'])
+
+class TestPatternCache(unittest.TestCase):
+    def setUp(self):
+        regex.clear_cache()
+
+    def tearDown(self):
+        regex.set_cache_size(128)
+        regex.clear_cache()
+
+    def test_hits_and_misses(self):
+        matcher = regex.compile_regex('ab*')
+        self.assertIs(regex.compile_regex('ab*'), matcher)
+        self.assertIsNot(regex.compile_regex('ab*', engine='table'), matcher)
+        self.assertIsNot(regex.compile_regex('ab*', cache=False), matcher)
+        info = regex.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 2, 2))
+
+    def test_lru_eviction(self):
+        regex.set_cache_size(2)
+        a = regex.compile_regex('a')
+        regex.compile_regex('b')
+        regex.compile_regex('a')
+        regex.compile_regex('c')
+        self.assertIs(regex.compile_regex('a'), a)
+        info = regex.cache_info()
+        self.assertEqual((info.evictions, info.currsize, info.maxsize), (1, 2, 2))
+        regex.compile_regex('b')
+        self.assertEqual(regex.cache_info().evictions, 2)
+
+    def test_threads(self):
+        import threading
+        patterns = ['a%d' % (i % 5) for i in range(200)]
+        threads = [threading.Thread(target=lambda: [regex.compile_regex(p) for p in patterns])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        info = regex.cache_info()
+        self.assertEqual(info.hits + info.misses, 800)
+        self.assertEqual(info.currsize, 5)
+
+class TestGrep(unittest.TestCase):
+    text = b'foo\nbar\nxfoo\n\nfo'
+
+    def grep(self, pattern, **options):
+        import io
+        out = io.BytesIO()
+        matcher = regex.compile_regex(pattern, engine='table')
+        regex.grep_file(matcher, io.BytesIO(self.text), out, **options)
+        return out.getvalue()
+
+    def test_blocks(self):
+        import io
+        import os
+        import tempfile
+        fd, path = tempfile.mkstemp()
+        os.write(fd, self.text)
+        os.close(fd)
+        try:
+            for block_size in [1, 2, 5, 100]:
+                with open(path, 'rb') as f:
+                    for blocks in [list(regex.iter_blocks(io.BytesIO(self.text), block_size)),
+                                   list(regex.iter_blocks(f, block_size))]:
+                        self.assertEqual(b''.join(blocks), self.text)
+                        self.assertTrue(all(block.endswith(b'\n') for block in blocks[:-1]))
+        finally:
+            os.remove(path)
+
+    def test_options(self):
+        self.assertEqual(self.grep('fo+'), b'foo\nxfoo\nfo\n')
+        self.assertEqual(self.grep('fo+', search=False), b'foo\nfo\n')
+        self.assertEqual(self.grep('fo+', line_number=True), b'1:foo\n3:xfoo\n5:fo\n')
+        self.assertEqual(self.grep('fo+', invert=True, line_number=True), b'2:bar\n4:\n')
+        self.assertEqual(self.grep('fo+', count=True, label='a.txt'), b'a.txt:3\n')
+        self.assertEqual(self.grep('x*', search=False, count=True), b'1\n')
+
+    def test_utf8(self):
+        import io
+        self.text = 'caf\u00e9\ncafe\n\u00e9t\u00e9\n'.encode()
+        self.assertEqual(self.grep('caf.', search=False), 'caf\u00e9\ncafe\n'.encode())
+        self.assertEqual(self.grep('\u00e9', count=True), b'2\n')
+        self.assertEqual(self.grep('[^a-z]t', line_number=True), '3:\u00e9t\u00e9\n'.encode())
+
+    def test_parallel(self):
+        import io
+        import os
+        import tempfile
+        paths = []
+        for text in [b''.join([b'%d foo%s\n' % (i, b'o' * (i % 3)) for i in range(20000)]), self.text]:
+            fd, path = tempfile.mkstemp()
+            os.write(fd, text)
+            os.close(fd)
+            paths.append(path)
+        try:
+            for options in [['-n'], ['-c'], ['-vn'], ['-xn']]:
+                argv = options + ['fo{3}', paths[0], paths[1]]
+                serial = io.BytesIO()
+                parallel = io.BytesIO()
+                self.assertEqual(regex.main(argv, serial), regex.main(argv + ['-j', '3'], parallel))
+                self.assertEqual(parallel.getvalue(), serial.getvalue())
+        finally:
+            for path in paths:
+                os.remove(path)
+
+    def test_errors(self):
+        # reported on stderr with exit status 2, as grep does
+        import contextlib
+        import io
+        import os
+        import tempfile
+        fd, path = tempfile.mkstemp()
+        os.write(fd, self.text)
+        os.close(fd)
+        try:
+            for jobs in [[], ['-j', '2']]:
+                out = io.BytesIO()
+                err = io.StringIO()
+                with contextlib.redirect_stderr(err):
+                    status = regex.main(jobs + ['fo+', path + '.missing', path], out)
+                self.assertEqual(status, 2)
+                self.assertIn('regex.py: %s.missing: ' % path, err.getvalue())
+                self.assertEqual(out.getvalue().count(b'foo'), 2)
+            err = io.StringIO()
+            with contextlib.redirect_stderr(err):
+                self.assertEqual(regex.main(['a(b', path], io.BytesIO()), 2)
+            self.assertIn('unmatched ( at position 1', err.getvalue())
+
+            class ClosedPipe(io.BytesIO):
+                def write(self, data):
+                    raise BrokenPipeError()
+
+            for jobs in [[], ['-j', '2']]:
+                err = io.StringIO()
+                with contextlib.redirect_stderr(err):
+                    self.assertEqual(regex.main(jobs + ['fo+', path], ClosedPipe()), 0)
+                self.assertEqual(err.getvalue(), '')
+        finally:
+            os.remove(path)
+
+    def test_parallel_window(self):
+        # blocks are submitted no faster than results are written
+        import io
+        import os
+        import tempfile
+
+        class Executor:
+            def __init__(self):
+                self.in_flight = 0
+                self.max_in_flight = 0
+
+            def submit(self, fn, *args):
+                executor = self
+                executor.in_flight += 1
+                executor.max_in_flight = max(executor.max_in_flight, executor.in_flight)
+
+                class Future:
+                    def result(self):
+                        executor.in_flight -= 1
+                        return 1, 0, b'x'
+                return Future()
+
+        fd, path = tempfile.mkstemp()
+        os.write(fd, b'foo\n' * (1 << 20))
+        os.close(fd)
+        try:
+            executor = Executor()
+            out = io.BytesIO()
+            options = regex.GrepOptions(True, False, False, False)
+            with open(path, 'rb') as f:
+                n_selected = regex.grep_file_parallel(executor, 1, path, f, out, options)
+            self.assertEqual(n_selected, len(out.getvalue()))
+            self.assertGreater(n_selected, 2)
+            self.assertEqual(executor.max_in_flight, 2)
+            self.assertEqual(executor.in_flight, 0)
+        finally:
+            os.remove(path)
+
 if __name__ == '__main__':
     unittest.main()
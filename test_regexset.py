@@ -0,0 +1,45 @@
+import regex
+import regexset
+import unittest
+
+class TestRegexSet(unittest.TestCase):
+    patterns = ['a+b', '[0-9]+', 'a.*', 'ab|ba', '(a|b)*a(a|b){6}']
+    strings = ['', 'ab', 'aab', '123', 'a123', 'ba', 'x ab 12', 'abababababbb', 'bbbbbbbbabbbbbbbbb']
+
+    def test_matches(self):
+        regex_set = regexset.RegexSet(self.patterns)
+        dfas = [regex.compile_regex(pattern) for pattern in self.patterns]
+        for s in self.strings:
+            expected = [i for i, dfa in enumerate(dfas) if dfa.match(s)]
+            self.assertEqual(regex_set.matches(s), expected)
+            self.assertEqual(regex_set.match(s), len(expected) > 0)
+
+    def test_search(self):
+        regex_set = regexset.RegexSet(self.patterns, search=True)
+        dfas = [regex.compile_regex(pattern) for pattern in self.patterns]
+        for s in self.strings:
+            expected = [i for i, dfa in enumerate(dfas) if dfa.search(s) is not None]
+            self.assertEqual(regex_set.matches(s), expected)
+
+    def test_bounded(self):
+        for search in [False, True]:
+            regex_set = regexset.RegexSet(self.patterns, search=search, max_states=4)
+            reference = regexset.RegexSet(self.patterns, search=search)
+            for _ in range(20):
+                for s in self.strings:
+                    self.assertEqual(regex_set.matches(s), reference.matches(s))
+                    self.assertLessEqual(len(regex_set.enum_states()), 4)
+            self.assertEqual(regex_set.thrashing, True)
+
+    def test_bytes(self):
+        # bytes would be read as Latin-1, so they are refused
+        regex_set = regexset.RegexSet(['\u00e9+'])
+        self.assertEqual(regex_set.matches('\u00e9'), [0])
+        for s in [b'\xe9', '\u00e9'.encode()]:
+            with self.assertRaises(TypeError):
+                regex_set.matches(s)
+            with self.assertRaises(TypeError):
+                regex_set.match(s)
+
+if __name__ == '__main__':
+    unittest.main()
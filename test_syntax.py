@@ -1,3 +1,4 @@
+import charset
 import lex
 import syntax
 
@@ -10,7 +11,10 @@ class TestSyntacticAnalysis(unittest.TestCase):
             print(actual)
         self.assertEqual(type(actual), type(expected))
         if type(actual) == syntax.CharNode:
-            self.assertEqual(actual.char_set, expected.char_set)
+            self.assertEqual(actual.intervals, expected.intervals)
+        elif type(actual) == syntax.GroupNode:
+            self.assertEqual(actual.index, expected.index)
+            self.check_tree(actual.operand, expected.operand, verbose)
         elif type(actual) == syntax.QuantificationNode:
             self.assertEqual(actual.lb, expected.lb)
             self.assertEqual(actual.ub, expected.ub)
@@ -36,7 +40,7 @@ class TestSyntacticAnalysis(unittest.TestCase):
         expected_tree = syntax.ConcatenationNode([
             syntax.CharNode({'a', 'b', 'c'}),
             syntax.CharNode({'b'}),
-            syntax.CharNode({chr(x) for x in range(128)}),
+            syntax.CharNode(intervals=charset.ANY),
             ])
         self.check_tree(actual_tree, expected_tree)
 
@@ -45,7 +49,7 @@ class TestSyntacticAnalysis(unittest.TestCase):
         actual_tokens = lex.lexical_analysis(regex)
         actual_tree = syntax.syntactic_analysis(actual_tokens)
         expected_tree = syntax.QuantificationNode(lb=0, ub=float('inf'),
-                                                  operand=syntax.CharNode({chr(x) for x in range(128)}))
+                                                  operand=syntax.CharNode(intervals=charset.ANY))
         self.check_tree(actual_tree, expected_tree)
 
     def test_grouping(self):
@@ -77,6 +81,60 @@ class TestSyntacticAnalysis(unittest.TestCase):
                 syntax.QuantificationNode(lb=1, ub=float('inf'), operand=\
                                           syntax.CharNode({'c'}))])
         self.check_tree(actual_tree, expected_tree)
-        
+
+class TestParse(unittest.TestCase):
+    check_tree = TestSyntacticAnalysis.check_tree
+
+    def test_same_as_syntactic_analysis(self):
+        for regex in ['', 'a', '[a-c]b.', '.*', '((ab?)c)+', '(a|b)|c+', 'ab|c', 'a(b|c)|d',
+                      '(a+b)*c+', '((a?b)*)+', '(a|b)*a(a|b){20}', 'a{2,4}b*', '()', '(a)(b)',
+                      '[-a]', '[]', 'a{', 'ERROR [0-9]+ timeout|WARN', '(?:a|b)c', '(?:)']:
+            expected_tree = syntax.syntactic_analysis(lex.lexical_analysis(regex))
+            self.check_tree(syntax.parse(regex), expected_tree)
+
+    def test_fixed_quirks(self):
+        # empty alternatives are epsilon, escapes only cover one char
+        self.check_tree(syntax.parse('a|'), syntax.UnionNode([syntax.CharNode({'a'}), syntax.EpsilonNode()]))
+        self.check_tree(syntax.parse('\\.a*'), syntax.ConcatenationNode([
+            syntax.CharNode({'.'}),
+            syntax.QuantificationNode(lb=0, ub=float('inf'), operand=syntax.CharNode({'a'}))]))
+        self.check_tree(syntax.parse('[\\]a]'), syntax.CharNode({']', 'a'}))
+        self.check_tree(syntax.parse('a{2,}'),
+                        syntax.QuantificationNode(lb=2, ub=float('inf'), operand=syntax.CharNode({'a'})))
+
+    def test_unicode(self):
+        # classes are intervals of code points, whatever their size
+        self.check_tree(syntax.parse('[^a-c\n]'), syntax.CharNode(intervals=((0, 9), (11, 96), (100, charset.MAX_CODE_POINT))))
+        self.check_tree(syntax.parse('[\u0400-\u04ff\U00010000-\U0010ffffx]'),
+                        syntax.CharNode(intervals=((120, 120), (0x400, 0x4ff), (0x10000, charset.MAX_CODE_POINT))))
+        self.check_tree(syntax.parse('[^]'), syntax.CharNode(intervals=charset.ANY))
+
+    def test_captures(self):
+        # groups are numbered by their '(', (?:...) is not counted
+        self.check_tree(syntax.parse('(a(?:b)(c))|(d)', captures=True), syntax.UnionNode([
+            syntax.GroupNode(1, syntax.ConcatenationNode([
+                syntax.CharNode({'a'}),
+                syntax.CharNode({'b'}),
+                syntax.GroupNode(2, syntax.CharNode({'c'}))])),
+            syntax.GroupNode(3, syntax.CharNode({'d'}))]))
+        self.check_tree(syntax.parse('(a)*', captures=True),
+                        syntax.QuantificationNode(lb=0, ub=float('inf'), operand=syntax.GroupNode(1, syntax.CharNode({'a'}))))
+
+    def test_errors(self):
+        for regex, pos in [('ab)', 2), ('a(b(c)', 1), ('*a', 0), ('a|+', 2), ('a**', 2),
+                           ('a[bc', 1), ('a{2,x}', 4), ('a{3,2}', 1), ('[z-a]', 1), ('ab\\', 2),
+                           ('a(?:b', 1), ('(?a)', 1)]:
+            with self.assertRaises(syntax.ParseError) as context:
+                syntax.parse(regex)
+            self.assertEqual(context.exception.pos, pos, regex)
+
+    def test_large(self):
+        # machine generated patterns, deep and wide
+        regex = '(' * 5000 + 'a' + ')' * 5000
+        self.check_tree(syntax.parse(regex), syntax.CharNode({'a'}))
+        words = ['w%d' % i for i in range(20000)]
+        tree = syntax.parse('|'.join(words))
+        self.assertEqual(len(tree.children), len(words))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,202 @@
+import regex
+import table
+import unittest
+
+class TestTableDFA(unittest.TestCase):
+    def test_same_as_dfa(self):
+        for pattern, strings in [('a{2,4}b*', ['abb', 'aaa', 'aaabb', 'aaaaabb']),
+                                 ('(a+b)*c+', ['aababc', 'c', 'aaaabab']),
+                                 ('((a?b)*)+', ['', 'bab', 'aab']),
+                                 ('a.b', ['axb', 'ab', 'axbx', 'aあb'])]:
+            dfa = regex.compile_regex(pattern)
+            matcher = table.TableDFA.from_dfa(dfa)
+            for s in strings:
+                self.assertEqual(matcher.match(s), dfa.match(s))
+
+    def test_layout(self):
+        matcher = regex.compile_regex('[a-c]x|[a-c]y', engine='table')
+        # dead, init, after [a-c], after x or y
+        self.assertEqual(matcher.n_states, 4)
+        # other, [a-c], x or y
+        self.assertEqual(matcher.n_classes, 3)
+        self.assertEqual(len(matcher.transitions), matcher.n_states * matcher.n_classes)
+        self.assertEqual(matcher.alphabet['a'], matcher.alphabet['c'])
+        self.assertEqual(matcher.is_accept(matcher.init_state), False)
+        self.assertEqual(matcher.match('bx'), True)
+        self.assertEqual(matcher.match('dx'), False)
+
+class TestSearch(unittest.TestCase):
+    def naive_finditer(self, dfa, s):
+        pos = 0
+        while pos <= len(s):
+            ends = [end for start in range(pos, len(s) + 1)
+                    for end in range(start, len(s) + 1) if dfa.match(s[start:end])]
+            if not ends:
+                return
+            start = min([start for start in range(pos, len(s) + 1)
+                         if any(dfa.match(s[start:end]) for end in range(start, len(s) + 1))])
+            end = max([end for end in range(start, len(s) + 1) if dfa.match(s[start:end])])
+            yield (start, end)
+            pos = end if end > start else end + 1
+
+    def test_leftmost_longest(self):
+        for pattern in ['a+b|c', 'a*', '(ab|a)(bc|c)?', 'b.b', 'x']:
+            dfa = regex.compile_regex(pattern)
+            for s in ['', 'xxaaabyc cc ab', 'abcabc', 'bbbab', 'baab', 'bxbxb']:
+                self.assertEqual(list(dfa.finditer(s)), list(self.naive_finditer(dfa, s)))
+
+    def test_entry_points(self):
+        dfa = regex.compile_regex('[0-9]+')
+        self.assertEqual(dfa.search('abc 123 45'), (4, 7))
+        self.assertEqual(dfa.search('abc'), None)
+        self.assertEqual(dfa.findall('abc 123 45'), ['123', '45'])
+        self.assertEqual(dfa.fullmatch('123'), True)
+        self.assertEqual(dfa.fullmatch('abc 123'), False)
+        matcher = regex.compile_regex('[0-9]+', engine='table')
+        self.assertEqual(matcher.findall('abc 123 45'), ['123', '45'])
+
+class TestBytes(unittest.TestCase):
+    def test_match(self):
+        matcher = regex.compile_regex('a.b|[0-9]+', engine='table')
+        self.assertEqual(len(matcher.byte_classes), 256)
+        for s in ['axb', 'ab', '123', '12a', 'a\x7fb']:
+            expected = matcher.match(s)
+            for buf in [s.encode('latin-1'), bytearray(s, 'latin-1'), memoryview(s.encode('latin-1'))]:
+                self.assertEqual(matcher.match(buf), expected)
+        # bytes are UTF-8, and b'\xff' is not valid UTF-8
+        self.assertEqual(matcher.match(b'a\xffb'), False)
+        self.assertEqual(regex.compile_regex('a.b').match(b'axb'), True)
+
+    def test_search(self):
+        dfa = regex.compile_regex('[0-9]+')
+        self.assertEqual(dfa.search(b'abc 123 45'), (4, 7))
+        self.assertEqual(dfa.findall(b'abc 123 45'), [b'123', b'45'])
+        self.assertEqual(dfa.findall(bytearray(b'abc 123 45')), [bytearray(b'123'), bytearray(b'45')])
+
+class TestStream(unittest.TestCase):
+    def test_chunks(self):
+        dfa = regex.compile_regex('(ab)*c')
+        stream = dfa.stream()
+        self.assertEqual(stream.is_accepting(), False)
+        self.assertEqual(stream.feed('aba'), True)
+        self.assertEqual(stream.feed(b'b'), True)
+        self.assertEqual(stream.is_accepting(), False)
+        self.assertEqual(stream.feed(memoryview(b'c')), True)
+        self.assertEqual(stream.is_accepting(), True)
+        self.assertEqual(stream.feed(''), True)
+        self.assertEqual(stream.is_accepting(), True)
+        self.assertEqual(stream.feed('c'), False)
+        self.assertEqual(stream.is_dead(), True)
+        self.assertEqual(stream.is_accepting(), False)
+        self.assertEqual(stream.feed('anything'), False)
+        stream.reset()
+        self.assertEqual(stream.is_dead(), False)
+        self.assertEqual(stream.feed(bytearray(b'c')), True)
+        self.assertEqual(stream.is_accepting(), True)
+
+    def test_split_anywhere(self):
+        dfa = regex.compile_regex('a{2,4}b*')
+        for s in ['abb', 'aaa', 'aaabb', 'aaaaabb']:
+            for cut in range(len(s) + 1):
+                stream = dfa.stream()
+                stream.feed(s[:cut])
+                stream.feed(s[cut:])
+                self.assertEqual(stream.is_accepting(), dfa.match(s))
+
+class TestSaveLoad(unittest.TestCase):
+    def test_round_trip(self):
+        import os
+        import tempfile
+        dfa = regex.compile_regex('[0-9]+x|a')
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            dfa.save(path)
+            for use_mmap in [True, False]:
+                loaded = table.TableDFA.load(path, use_mmap=use_mmap)
+                self.assertEqual(loaded.alphabet.starts, dfa.compiled().alphabet.starts)
+                self.assertEqual(loaded.alphabet.values, dfa.compiled().alphabet.values)
+                self.assertEqual(list(loaded.transitions), list(dfa.compiled().transitions))
+                self.assertEqual(loaded.match('12x'), True)
+                self.assertEqual(loaded.match('12'), False)
+                self.assertIsNotNone(loaded.reverse_dfa)
+                self.assertEqual(loaded.findall('a 12x 3x'), ['a', '12x', '3x'])
+        finally:
+            os.remove(path)
+
+    def test_without_reverse(self):
+        matcher = regex.compile_regex('ab', engine='table')
+        loaded = table.TableDFA.from_bytes(matcher.to_bytes(with_reverse=False))
+        self.assertIsNone(loaded.reverse_dfa)
+        self.assertEqual(loaded.search('xxab'), (2, 4))
+
+    def test_utf8(self):
+        # the UTF-8 DFA is saved along, so bytes still read as UTF-8
+        matcher = regex.compile_regex('a\u00e9+b', engine='table', cache=False)
+        for with_reverse in [True, False]:
+            loaded = table.TableDFA.from_bytes(matcher.to_bytes(with_reverse))
+            self.assertIsNotNone(loaded.utf8)
+            self.assertEqual(loaded.utf8.reverse_dfa is not None, with_reverse)
+            self.assertTrue(loaded.match('a\u00e9\u00e9b'))
+            self.assertTrue(loaded.match('a\u00e9\u00e9b'.encode()))
+            self.assertFalse(loaded.match('a\u00e9b'.encode('latin-1')))
+            self.assertEqual(loaded.findall('xa\u00e9b a\u00e9\u00e9b'.encode()),
+                             ['a\u00e9b'.encode(), 'a\u00e9\u00e9b'.encode()])
+        self.assertIsNone(table.TableDFA.from_bytes(regex.compile_regex('ab', engine='table').to_bytes()).utf8)
+
+    def test_invalid(self):
+        buf = regex.compile_regex('ab', engine='table').to_bytes()
+        with self.assertRaises(Exception):
+            table.TableDFA.from_bytes(b'XXXX' + buf[4:])
+        with self.assertRaises(Exception):
+            table.TableDFA.from_bytes(buf[:4] + b'\x09\x00' + buf[6:])
+        with self.assertRaises(Exception):
+            table.TableDFA.from_bytes(buf[:30])
+
+class TestMatchMany(unittest.TestCase):
+    def setUp(self):
+        self.dfa = regex.compile_regex('(a|b)*c[0-9]+', engine='table', cache=False)
+        self.strings = ['', 'c1', 'abac09', 'abc', 'xc1', 'c1x', 'bbbbbbc123', 'c\xe90']
+        self.expected = [self.dfa.match(s) for s in self.strings]
+
+    def test_lists(self):
+        self.assertEqual(list(self.dfa.match_many(self.strings)), self.expected)
+        strings = [s.encode('latin-1') for s in self.strings]
+        self.assertEqual(list(self.dfa.match_many(strings)), self.expected)
+        self.assertEqual(list(self.dfa.match_many([])), [])
+
+    def test_without_numpy(self):
+        numpy = table.numpy
+        table.numpy = None
+        try:
+            self.assertEqual(self.dfa.match_many(self.strings), self.expected)
+        finally:
+            table.numpy = numpy
+
+    @unittest.skipIf(table.numpy is None, 'numpy is not installed')
+    def test_arrays(self):
+        numpy = table.numpy
+        self.assertEqual(list(self.dfa.match_many(numpy.array(self.strings))), self.expected)
+        strings = numpy.array([s.encode('latin-1') for s in self.strings])
+        self.assertEqual(list(self.dfa.match_many(strings)), self.expected)
+        # explicit lengths cut the strings short
+        self.assertEqual(list(self.dfa.match_many(numpy.array(['c12', 'c1x']), [2, 2])), [True, True])
+
+    @unittest.skipIf(table.numpy is None, 'numpy is not installed')
+    def test_chunks(self):
+        # rows are matched a few at a time, shortest first, and the
+        # results put back in order
+        numpy = table.numpy
+        strings = self.strings + ['ab' * 20 + 'c1', 'c' + '1' * 30 + 'x'] + self.strings
+        expected = [self.dfa.match(s) for s in strings]
+        cells, rows = table.MATCH_MANY_CELLS, table.MATCH_MANY_ROWS
+        table.MATCH_MANY_CELLS, table.MATCH_MANY_ROWS = 8, 2
+        try:
+            self.assertEqual(list(self.dfa.match_many(strings)), expected)
+            self.assertEqual(list(self.dfa.match_many([s.encode('latin-1') for s in strings])), expected)
+            self.assertEqual(list(self.dfa.match_many(numpy.array(strings))), expected)
+        finally:
+            table.MATCH_MANY_CELLS, table.MATCH_MANY_ROWS = cells, rows
+
+if __name__ == '__main__':
+    unittest.main()